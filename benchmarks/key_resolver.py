@@ -0,0 +1,68 @@
+"""
+Signature verifications per second on hot keys, with and without the parsed public key cache
+
+    uv run python benchmarks/key_resolver.py
+"""
+
+import argparse
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+from dnstapir.key_cache import MemoryKeyCache
+from dnstapir.key_resolver import FileKeyResolver
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Key resolver benchmark")
+    parser.add_argument("--keys", type=int, default=100, help="Number of hot keys")
+    parser.add_argument("--count", type=int, default=100_000, help="Verifications per run")
+    args = parser.parse_args()
+
+    message = b"hello world"
+    signatures = {}
+
+    with TemporaryDirectory(prefix="dnstapir") as directory:
+        for n in range(args.keys):
+            key_id = f"node{n}"
+            private_key = ed25519.Ed25519PrivateKey.generate()
+            public_key_pem = private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+            )
+            (Path(directory) / f"{key_id}.pem").write_bytes(public_key_pem)
+            signatures[key_id] = private_key.sign(message)
+
+        key_ids = [f"node{n % args.keys}" for n in range(args.count)]
+
+        for public_key_cache_size in (0, args.keys):
+            resolver = FileKeyResolver(
+                client_database_directory=directory,
+                key_cache=MemoryKeyCache(size=args.keys, ttl=3600),
+                public_key_cache_size=public_key_cache_size,
+                public_key_cache_ttl=3600,
+            )
+            for key_id in signatures:
+                resolver.resolve_public_key(key_id)
+
+            t1 = time.perf_counter()
+            for key_id in key_ids:
+                resolver.resolve_public_key(key_id)
+            resolved = time.perf_counter() - t1
+
+            t1 = time.perf_counter()
+            for key_id in key_ids:
+                resolver.resolve_public_key(key_id).verify(signatures[key_id], message)
+            verified = time.perf_counter() - t1
+
+            print(
+                f"public_key_cache_size={public_key_cache_size:<6}"
+                f" {len(key_ids) / resolved:10.0f} lookups/s"
+                f" {len(key_ids) / verified:10.0f} verifications/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Throughput of PublicSuffixList.coredomain_many() against a scalar coredomain() loop
+
+    uv run python benchmarks/mozpsl_batch.py --psl public_suffix_list.dat
+"""
+
+import argparse
+import random
+import time
+
+from dnstapir.dns.mozpsl import PublicSuffixList
+
+MOZ_PSL = "https://publicsuffix.org/list/public_suffix_list.dat"
+
+
+def load(psl_source: str) -> PublicSuffixList:
+    psl = PublicSuffixList()
+    if psl_source.startswith("http://") or psl_source.startswith("https://"):
+        psl.load_psl_url(psl_source)
+    else:
+        with open(psl_source) as fp:
+            psl.load_psl(fp)
+    return psl
+
+
+def corpus(count: int, distinct: int, seed: int = 0) -> list[str]:
+    """Generate a Zipf-like skewed list of query names"""
+    rng = random.Random(seed)
+    suffixes = ["com", "net", "org", "se", "co.uk", "com.br", "github.io", "s3.amazonaws.com", "invalid"]
+    names = [
+        ".".join(
+            [f"h{rng.randrange(100)}"] * rng.randrange(3) + [f"d{i}", rng.choice(suffixes)],
+        )
+        + "."
+        for i in range(distinct)
+    ]
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    return rng.choices(names, weights=weights, k=count)
+
+
+def scalar(psl: PublicSuffixList, names: list[str]) -> None:
+    for name in names:
+        try:
+            psl.coredomain(name)
+        except KeyError:
+            continue
+
+
+def batch(psl: PublicSuffixList, names: list[str]) -> None:
+    psl.coredomain_many(names)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PSL batch benchmark")
+    parser.add_argument("--psl", default=MOZ_PSL, help="PSL file or URL")
+    parser.add_argument("--count", type=int, default=1_000_000, help="Names per batch")
+    parser.add_argument("--distinct", type=int, default=50_000, help="Distinct names")
+    args = parser.parse_args()
+
+    psl = load(args.psl)
+    names = corpus(args.count, args.distinct)
+
+    for func in (scalar, batch):
+        t1 = time.perf_counter()
+        func(psl, names)
+        elapsed = time.perf_counter() - t1
+        print(f"{func.__name__:8} {len(names) / elapsed:12.0f} names/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Memory footprint and lookup rate of the Trie and CompiledTrie engines
+
+    uv run python benchmarks/mozpsl_engine.py --psl public_suffix_list.dat
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from mozpsl_batch import MOZ_PSL, corpus
+
+from dnstapir.dns.mozpsl import PublicSuffixList
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PSL engine benchmark")
+    parser.add_argument("--psl", default=MOZ_PSL, help="PSL file or URL")
+    parser.add_argument("--count", type=int, default=1_000_000, help="Names to look up")
+    args = parser.parse_args()
+
+    if args.psl.startswith("http://") or args.psl.startswith("https://"):
+        psl = PublicSuffixList()
+        psl.load_psl_url(args.psl)
+        text = None
+    else:
+        with open(args.psl) as fp:
+            text = fp.read()
+
+    names = corpus(args.count, args.count // 20)
+
+    for compiled in (False, True):
+        gc.collect()
+        tracemalloc.start()
+        psl = PublicSuffixList(compiled=compiled)
+        if text is None:
+            psl.load_psl_url(args.psl)
+        else:
+            psl.load_psl(text.splitlines())
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        search = psl.trie.search
+        keys = [name.rstrip(".").split(".")[::-1] for name in names]
+        t1 = time.perf_counter()
+        for key in keys:
+            try:
+                search(key)
+            except KeyError:
+                continue
+        elapsed = time.perf_counter() - t1
+
+        engine = type(psl.trie).__name__
+        print(f"{engine:12} {size / 1024:8.0f} KiB {len(keys) / elapsed:12.0f} searches/s")
+
+
+if __name__ == "__main__":
+    main()
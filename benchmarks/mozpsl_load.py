@@ -0,0 +1,72 @@
+"""
+Load time and peak memory of PublicSuffixList.load_psl() and load_psl_url()
+
+The URL case is served from a local HTTP server.
+
+    uv run python benchmarks/mozpsl_load.py --psl public_suffix_list.dat
+"""
+
+import argparse
+import gc
+import os
+import threading
+import time
+import tracemalloc
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from dnstapir.dns.mozpsl import PublicSuffixList
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(name: str, func, rounds: int) -> None:
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        t1 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t1)
+
+    # Tracing slows allocations down, so measure memory in a separate round
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"{name:8} {min(timings) * 1000:8.1f} ms {peak / 1024:8.0f} KiB peak")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PSL load benchmark")
+    parser.add_argument("--psl", required=True, help="PSL file")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds per case")
+    args = parser.parse_args()
+
+    directory, filename = os.path.split(os.path.abspath(args.psl))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/{filename}"
+
+    def load_file() -> None:
+        with open(args.psl) as fp:
+            PublicSuffixList().load_psl(fp)
+
+    def load_path() -> None:
+        PublicSuffixList().load_psl(args.psl)
+
+    def load_url() -> None:
+        PublicSuffixList().load_psl_url(url)
+
+    measure("file", load_file, args.rounds)
+    measure("path", load_path, args.rounds)
+    measure("url", load_url, args.rounds)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Offline benchmark suite for dnstapir.dns.mozpsl, reporting JSON
+
+Runs against the PSL snapshot vendored in tests/data and a generated,
+skewed query name corpus. Reports load times, trie memory footprint,
+lookups per second and p50/p99 per-lookup latency (including timer
+overhead) for each engine.
+
+    uv run python benchmarks/mozpsl_suite.py --output mozpsl.json
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from contextlib import suppress
+from pathlib import Path
+
+from dnstapir.dns.mozpsl import PublicSuffixList
+
+VENDORED_PSL = Path(__file__).parent.parent / "tests" / "data" / "public_suffix_list.dat"
+
+# Suffixes per corpus category, with category weights
+CATEGORIES: dict[str, tuple[float, list[str]]] = {
+    "icann": (0.55, ["com", "net", "org", "se", "de", "co.uk", "com.br", "gov.ck", "city.kawasaki.jp"]),
+    "deep": (0.15, ["com", "net", "org", "ac.uk", "kawasaki.jp"]),
+    "private": (
+        0.15,
+        ["github.io", "blogspot.com", "s3.amazonaws.com", "eu-west-1.compute.amazonaws.com", "herokuapp.com"],
+    ),
+    "idn": (0.05, ["xn--p1ai", "xn--fiqs8s", "de", "xn--80ao21a"]),
+    "unknown": (0.10, ["invalid", "local", "lan", "home.arpa", "internal", "xn--zz99"]),
+}
+
+
+def _label(rng: random.Random, idn: bool = False) -> str:
+    label = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=rng.randint(2, 12)))
+    return f"xn--{label}-{rng.randint(0, 999)}a" if idn else label
+
+
+def qname_corpus(count: int, distinct: int, seed: int = 0) -> tuple[list[str], dict[str, int]]:
+    """Generate Zipf-skewed query names, returning names and distinct names per category"""
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    weights = [CATEGORIES[category][0] for category in categories]
+    names = []
+    per_category = dict.fromkeys(categories, 0)
+    for category in rng.choices(categories, weights=weights, k=distinct):
+        suffix = rng.choice(CATEGORIES[category][1])
+        depth = rng.randint(4, 10) if category == "deep" else rng.randint(0, 2)
+        labels = [_label(rng) for _ in range(depth)] + [_label(rng, idn=category == "idn")]
+        if category == "private":
+            labels.append(_label(rng))
+        names.append(".".join([*labels, suffix]) + ".")
+        per_category[category] += 1
+    rng.shuffle(names)
+    zipf = [1 / (rank + 1) for rank in range(distinct)]
+    return rng.choices(names, weights=zipf, k=count), per_category
+
+
+def to_wire(name: str) -> bytes:
+    return b"".join(bytes([len(label)]) + label.encode() for label in name.rstrip(".").split(".")) + b"\x00"
+
+
+def best_of(rounds: int, func: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(rounds):
+        gc.collect()
+        t1 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t1)
+    return min(timings)
+
+
+def retained_memory(func: Callable[[], object]) -> int:
+    """Memory retained by the object returned by func"""
+    gc.collect()
+    tracemalloc.start()
+    res = func()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del res
+    return size
+
+
+def throughput(names: list, lookup: Callable[[object], object]) -> float:
+    t1 = time.perf_counter()
+    for name in names:
+        try:
+            lookup(name)
+        except KeyError:
+            continue
+    return len(names) / (time.perf_counter() - t1)
+
+
+def latency(names: list, lookup: Callable[[object], object]) -> dict[str, float]:
+    """Per-lookup latency percentiles in nanoseconds"""
+    clock = time.perf_counter_ns
+    samples = []
+    for name in names:
+        t1 = clock()
+        with suppress(KeyError):
+            lookup(name)
+        samples.append(clock() - t1)
+    quantiles = statistics.quantiles(samples, n=100)
+    return {"p50_ns": quantiles[49], "p99_ns": quantiles[98]}
+
+
+def run(psl_path: str, count: int, distinct: int, seed: int, samples: int, rounds: int) -> dict:
+    with open(psl_path, "rb") as fp:
+        psl_bytes = fp.read()
+    names, per_category = qname_corpus(count, distinct, seed)
+    sample = names[:samples]
+    wire_names = [to_wire(name) for name in names]
+    keys = [name.rstrip(".").split(".")[::-1] for name in names]
+    results: dict = {
+        "python": platform.python_version(),
+        "psl": {"path": str(psl_path), "sha256": hashlib.sha256(psl_bytes).hexdigest()},
+        "corpus": {"count": count, "distinct": distinct, "seed": seed, "categories": per_category},
+        "engines": {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = os.path.join(directory, "psl.snapshot")
+        compiled_psl = PublicSuffixList(compiled=True)
+        compiled_psl.load_psl(psl_path)
+        compiled_psl.save_snapshot(snapshot)
+        results["snapshot_load_s"] = best_of(rounds, lambda: PublicSuffixList.from_snapshot(snapshot))
+
+    for engine, kwargs in (
+        ("trie", {}),
+        ("compiled", {"compiled": True}),
+        ("compiled_cached", {"compiled": True, "cache_size": distinct}),
+    ):
+        psl = PublicSuffixList(**kwargs)
+        load_s = best_of(rounds, lambda psl=psl: psl.load_psl(psl_path))
+
+        def build(kwargs=kwargs):
+            res = PublicSuffixList(**kwargs)
+            res.load_psl(psl_path)
+            return res.trie
+
+        # Build wire format trie before measuring
+        psl.coredomain_wire(to_wire("example.com."))
+        if psl.cache is not None:
+            # Measure a warm cache
+            psl.coredomain_many(names)
+        results["engines"][engine] = {
+            "load_s": load_s,
+            "memory_bytes": retained_memory(build),
+            "search_per_s": throughput(keys, psl.trie.search),
+            "coredomain_per_s": throughput(names, psl.coredomain),
+            "coredomain_many_per_s": count / best_of(rounds, lambda psl=psl: psl.coredomain_many(names)),
+            "coredomain_wire_per_s": throughput(wire_names, psl.coredomain_wire),
+            "coredomain_latency": latency(sample, psl.coredomain),
+            "coredomain_wire_latency": latency([to_wire(name) for name in sample], psl.coredomain_wire),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PSL benchmark suite")
+    parser.add_argument("--psl", default=str(VENDORED_PSL), help="PSL file")
+    parser.add_argument("--count", type=int, default=500_000, help="Names to look up")
+    parser.add_argument("--distinct", type=int, default=50_000, help="Distinct names")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus seed")
+    parser.add_argument("--samples", type=int, default=100_000, help="Lookups timed individually")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per load measurement")
+    parser.add_argument("--output", help="Output file (default stdout)")
+    args = parser.parse_args()
+
+    results = run(args.psl, args.count, args.distinct, args.seed, args.samples, args.rounds)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
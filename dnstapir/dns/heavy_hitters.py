@@ -0,0 +1,297 @@
+import hashlib
+import heapq
+import json
+import math
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter, namedtuple
+from collections.abc import Iterable
+from typing import Self
+
+from .mozpsl import PublicSuffixList
+
+SNAPSHOT_MAGIC = b"DNSTAPIR-AGG"
+SNAPSHOT_VERSION = 1
+
+# magic, version, width, depth, capacity, seed, total, unmatched, payload CRC-32
+SNAPSHOT_HEADER = struct.Struct("<12sHIIIQQQI")
+
+HeavyHitter = namedtuple("HeavyHitter", ["domain", "count", "error"])
+
+
+class CountMinSketch:
+    """Count-Min Sketch (Cormode & Muthukrishnan)
+
+    Estimates never undercount, and overcount by more than epsilon * total
+    with probability at most delta, where epsilon = e / width and
+    delta = exp(-depth). Sketches with the same dimensions and seed are
+    merged by adding counters.
+    """
+
+    def __init__(self, width: int, depth: int, seed: int = 0) -> None:
+        if width < 1 or depth < 1:
+            raise ValueError("Width and depth must be positive")
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.total = 0
+        self.counters = array("Q", bytes(8 * width * depth))
+        self._hash_key = seed.to_bytes(8, "little")
+
+    @classmethod
+    def from_error(cls, epsilon: float, delta: float, seed: int = 0) -> Self:
+        """Create sketch with the given error bounds"""
+        if not 0 < epsilon < 1 or not 0 < delta < 1:
+            raise ValueError("Epsilon and delta must be between 0 and 1")
+        return cls(width=math.ceil(math.e / epsilon), depth=math.ceil(math.log(1 / delta)), seed=seed)
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    def _indexes(self, key: str) -> list[int]:
+        """Counter index per row, using double hashing of a single keyed hash"""
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8, key=self._hash_key).digest(), "little")
+        h1, h2 = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1) -> None:
+        counters = self.counters
+        for index in self._indexes(key):
+            counters[index] += count
+        self.total += count
+
+    def estimate(self, key: str) -> int:
+        counters = self.counters
+        return min(counters[index] for index in self._indexes(key))
+
+    def merge(self, other: "CountMinSketch") -> None:
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise ValueError("Cannot merge sketches with different dimensions or seeds")
+        counters = self.counters
+        for index, value in enumerate(other.counters):
+            if value:
+                counters[index] += value
+        self.total += other.total
+
+
+class SpaceSaving:
+    """Space-Saving top-K summary (Metwally, Agrawal & El Abbadi)
+
+    Monitors at most capacity keys. Each monitored key has a count that never
+    undercounts and an error such that count - error never overcounts, with
+    error at most total / capacity. Unmonitored keys occurred at most
+    min_count() times. Summaries are merged as described by Agarwal et al.,
+    "Mergeable Summaries", keeping the same bounds over the combined total.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("Capacity must be positive")
+        self.capacity = capacity
+        self.total = 0
+        self.counters: dict[str, list[int]] = {}
+        # One (count, key) entry per monitored key, counts possibly outdated
+        self._heap: list[tuple[int, str]] = []
+
+    def add(self, key: str, count: int = 1) -> None:
+        self.total += count
+        if (counter := self.counters.get(key)) is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [count, 0]
+            heapq.heappush(self._heap, (count, key))
+        else:
+            minimum, evicted = self._pop_min()
+            del self.counters[evicted]
+            self.counters[key] = [minimum + count, minimum]
+            heapq.heappush(self._heap, (minimum + count, key))
+
+    def _pop_min(self) -> tuple[int, str]:
+        # Counts only grow, so an up to date heap top is the true minimum
+        heap = self._heap
+        while True:
+            value, key = heap[0]
+            current = self.counters[key][0]
+            if value == current:
+                return heapq.heappop(heap)
+            heapq.heapreplace(heap, (current, key))
+
+    def min_count(self) -> int:
+        """Upper bound for the count of any unmonitored key"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def get(self, key: str) -> tuple[int, int] | None:
+        """Return count and error of a monitored key"""
+        counter = self.counters.get(key)
+        return (counter[0], counter[1]) if counter is not None else None
+
+    def items(self) -> list[tuple[str, int, int]]:
+        """Return (key, count, error) of monitored keys, highest count first"""
+        return sorted(((key, count, error) for key, (count, error) in self.counters.items()), key=_by_count)
+
+    def merge(self, other: "SpaceSaving") -> None:
+        min_self, min_other = self.min_count(), other.min_count()
+        merged = []
+        for key in self.counters.keys() | other.counters.keys():
+            count1, error1 = self.counters.get(key, (min_self, min_self))
+            count2, error2 = other.counters.get(key, (min_other, min_other))
+            merged.append((key, count1 + count2, error1 + error2))
+        merged.sort(key=_by_count)
+        self._load(merged[: self.capacity])
+        self.total += other.total
+
+    def _load(self, items: Iterable[tuple[str, int, int]]) -> None:
+        self.counters = {key: [count, error] for key, count, error in items}
+        self._heap = [(count, key) for key, (count, _) in self.counters.items()]
+        heapq.heapify(self._heap)
+
+
+def _by_count(item: tuple[str, int, int]) -> tuple[int, str]:
+    return -item[1], item[0]
+
+
+class CoreDomainAggregator:
+    """Approximate query counts and top-K per core domain in fixed memory
+
+    Names are rolled up using PublicSuffixList.coredomain(). Counts for any
+    domain are estimated by a Count-Min Sketch with the given epsilon and
+    delta, and the heaviest domains are tracked by Space-Saving with room
+    for capacity domains. With private set, names are rolled up to the
+    private core domain where there is one. Names not covered by the list,
+    or invalid, are counted as unmatched. Aggregators created with the same parameters can
+    be merged, also from snapshots, across workers and time windows.
+    """
+
+    def __init__(
+        self,
+        psl: PublicSuffixList | None = None,
+        epsilon: float = 0.001,
+        delta: float = 0.001,
+        capacity: int = 1000,
+        seed: int = 0,
+        private: bool = False,
+    ) -> None:
+        self.psl = psl
+        self.private = private
+        self.sketch = CountMinSketch.from_error(epsilon=epsilon, delta=delta, seed=seed)
+        self.top_k = SpaceSaving(capacity=capacity)
+        self.unmatched = 0
+
+    @property
+    def total(self) -> int:
+        """Number of names counted, excluding unmatched"""
+        return self.sketch.total
+
+    def _domain(self, core: str, pcore: str) -> str:
+        # Names only covered by private domains have no ICANN core domain
+        return pcore if (self.private or not core) and pcore else core
+
+    def add(self, name: str, count: int = 1) -> str | None:
+        """Count name, returning the domain counted or None if unmatched"""
+        if self.psl is None:
+            raise ValueError("No PSL to look up names")
+        try:
+            domain = self._domain(*self.psl.coredomain(name))
+        except (KeyError, ValueError):
+            self.unmatched += count
+            return None
+        self.add_domain(domain, count)
+        return domain
+
+    def add_many(self, names: Iterable[str]) -> None:
+        """Count names, looking up each distinct domain once per batch"""
+        if self.psl is None:
+            raise ValueError("No PSL to look up names")
+        counts: Counter[str] = Counter()
+        for core, pcore in zip(*self.psl.coredomain_many(names), strict=True):
+            if core is None:
+                self.unmatched += 1
+            else:
+                counts[self._domain(core, pcore)] += 1
+        for domain, count in counts.items():
+            self.add_domain(domain, count)
+
+    def add_domain(self, domain: str, count: int = 1) -> None:
+        """Count an already rolled up domain"""
+        self.sketch.add(domain, count)
+        self.top_k.add(domain, count)
+
+    def estimate(self, domain: str) -> int:
+        """Upper bound for the count of domain"""
+        estimate = self.sketch.estimate(domain)
+        counter = self.top_k.get(domain)
+        return min(estimate, counter[0] if counter is not None else self.top_k.min_count())
+
+    def top(self, k: int | None = None) -> list[HeavyHitter]:
+        """Return the heaviest domains, with count - error a lower bound of the true count"""
+        res = []
+        for domain, count, error in self.top_k.items():
+            estimate = min(count, self.sketch.estimate(domain))
+            res.append(HeavyHitter(domain, estimate, estimate - (count - error)))
+        res.sort(key=_by_count)
+        return res[:k]
+
+    def merge(self, other: "CoreDomainAggregator") -> None:
+        """Merge counts from other aggregator into this one"""
+        if other.private != self.private:
+            raise ValueError("Cannot merge aggregators with different domain roll up")
+        self.sketch.merge(other.sketch)
+        self.top_k.merge(other.top_k)
+        self.unmatched += other.unmatched
+
+    def to_bytes(self) -> bytes:
+        """Serialize counts, e.g. for merging in another process"""
+        counters = array("Q", self.sketch.counters)
+        if sys.byteorder != "little":
+            counters.byteswap()
+        payload = counters.tobytes() + json.dumps([self.private, self.top_k.items()]).encode()
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            self.sketch.width,
+            self.sketch.depth,
+            self.top_k.capacity,
+            self.sketch.seed,
+            self.sketch.total,
+            self.unmatched,
+            zlib.crc32(payload),
+        )
+        return header + payload
+
+    @classmethod
+    def from_bytes(cls, data: bytes, psl: PublicSuffixList | None = None) -> Self:
+        """Create aggregator from to_bytes() output"""
+        try:
+            magic, version, width, depth, capacity, seed, total, unmatched, crc = SNAPSHOT_HEADER.unpack_from(data)
+        except struct.error as exc:
+            raise ValueError("Truncated aggregator snapshot") from exc
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Not an aggregator snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported aggregator snapshot version {version}")
+        payload = memoryview(data)[SNAPSHOT_HEADER.size :]
+        if zlib.crc32(payload) != crc or len(payload) < 8 * width * depth:
+            raise ValueError("Corrupt aggregator snapshot")
+
+        res = cls(psl=psl, capacity=capacity, seed=seed)
+        res.sketch = CountMinSketch(width=width, depth=depth, seed=seed)
+        res.sketch.counters = array("Q")
+        res.sketch.counters.frombytes(payload[: 8 * width * depth])
+        if sys.byteorder != "little":
+            res.sketch.counters.byteswap()
+        res.sketch.total = total
+        res.private, items = json.loads(bytes(payload[8 * width * depth :]))
+        res.top_k._load(items)
+        res.top_k.total = total
+        res.unmatched = unmatched
+        return res
@@ -1,11 +1,105 @@
-import io
+import argparse
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, Self
 
 import httpx
 
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"DNSTAPIR-PSL"
+SNAPSHOT_VERSION = 2
+
+# RFC 1035 limits
+MAX_LABEL_LENGTH = 63
+MAX_NAME_LENGTH = 255
+
+# magic, version, node count, labels size, payload CRC-32, SHA-256 of source list,
+# padded to 64 bytes so the uint32 sections following the padded labels are aligned
+SNAPSHOT_HEADER = struct.Struct("<12sHIII32s6x")
+
+
+def _as_list(values: Iterable[Any]) -> list[Any]:
+    """Materialize names from a list, generator, NumPy or Arrow array"""
+    if isinstance(values, list):
+        return values
+    if hasattr(values, "to_pylist"):
+        # pyarrow.Array and pyarrow.ChunkedArray
+        return values.to_pylist()
+    if hasattr(values, "tolist"):
+        # numpy.ndarray and pandas.Series
+        return values.tolist()
+    return list(values)
+
+
+def _iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Split stream of byte chunks into lines, keeping line endings"""
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(b"\n") else b""
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _read_snapshot(data: bytes, checksum: bytes | None) -> tuple["CompiledTrie", bytes]:
+    """Read snapshot written by PublicSuffixList.save_snapshot()"""
+    try:
+        magic, version, nodes, labels_size, crc, source_checksum = SNAPSHOT_HEADER.unpack_from(data)
+    except struct.error as exc:
+        raise ValueError("Truncated PSL snapshot") from exc
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Not a PSL snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported PSL snapshot version {version}")
+    if checksum is not None and checksum != source_checksum:
+        raise ValueError("PSL snapshot checksum mismatch")
+
+    offset = SNAPSHOT_HEADER.size
+    sizes = (labels_size + (-labels_size % 4), 4 * (nodes + 1), 4 * nodes, nodes, nodes)
+    if len(data) != offset + sum(sizes):
+        raise ValueError("Truncated PSL snapshot")
+
+    view = memoryview(data)
+    if zlib.crc32(view[offset:]) != crc:
+        raise ValueError("Corrupt PSL snapshot")
+    sections = []
+    for size in sizes:
+        sections.append(view[offset : offset + size])
+        offset += size
+    labels = str(sections[0][:labels_size], "ascii").split("\n")
+    uint32: list[memoryview | array] = []
+    for section in sections[1:3]:
+        if sys.byteorder == "little":
+            uint32.append(section.cast("I"))
+        else:
+            swapped = array("I")
+            swapped.frombytes(section)
+            swapped.byteswap()
+            uint32.append(swapped)
+    return CompiledTrie.from_arrays(labels, uint32[0], uint32[1], sections[3], sections[4].cast("b")), source_checksum
+
 
 class TrieNode:
     """ "Storage class for Trie"""
 
+    __slots__ = ("count", "icann", "children")
+
     def __init__(self) -> None:
         self.count = 0
         self.icann: bool | None = None
@@ -66,27 +160,254 @@ class Trie:
         return (core, pcore)
 
 
+Edge = tuple[dict[str, "Edge"], bool | None, int]
+
+
+class CompiledTrie:
+    """Read-only Trie compiled into nested dicts
+
+    Every edge maps a label to a (children, icann, count) tuple. Labels are
+    interned, all leaves share one empty children dict and leaves with equal
+    data share one edge tuple, so only interior nodes cost any objects.
+    """
+
+    __slots__ = ("root",)
+
+    def __init__(self, root: dict[str, Edge]) -> None:
+        self.root = root
+
+    @classmethod
+    def from_trie(cls, trie: Trie) -> "CompiledTrie":
+        """Compile Trie"""
+        labels: dict[str, str] = {}
+        leaf_children: dict[str, Edge] = {}
+        leaves: dict[tuple[bool | None, int], Edge] = {}
+
+        def compile_node(node: TrieNode) -> dict[str, Edge]:
+            res: dict[str, Edge] = {}
+            for key, child in node.children.items():
+                if child.children:
+                    edge = (compile_node(child), child.icann, child.count)
+                else:
+                    edge = leaves.setdefault((child.icann, child.count), (leaf_children, child.icann, child.count))
+                res[labels.setdefault(key, key)] = edge
+            return res
+
+        return cls(compile_node(trie.root))
+
+    @classmethod
+    def from_arrays(
+        cls,
+        labels: list[str],
+        first_child: memoryview | array,
+        label: memoryview | array,
+        count: memoryview | array,
+        icann: memoryview | array,
+    ) -> "CompiledTrie":
+        """Compile Trie from flat arrays, see to_arrays()"""
+        flags = (False, True, None)
+        edge_labels = [labels[n] for n in label.tolist()]
+        edge_flags = [flags[n] for n in icann.tolist()]
+        counts = count.tolist()
+        first = first_child.tolist()
+        leaf_children: dict[str, Edge] = {}
+        leaves: dict[tuple[bool | None, int], Edge] = {}
+
+        # Children are numbered after their parent, so build bottom up
+        nodes = [leaf_children] * len(edge_labels)
+        for node in range(len(edge_labels) - 1, -1, -1):
+            if first[node] == first[node + 1]:
+                continue
+            res: dict[str, Edge] = {}
+            for child in range(first[node], first[node + 1]):
+                if (children := nodes[child]) is leaf_children:
+                    edge = leaves.setdefault(
+                        (edge_flags[child], counts[child]), (leaf_children, edge_flags[child], counts[child])
+                    )
+                else:
+                    edge = (children, edge_flags[child], counts[child])
+                res[edge_labels[child]] = edge
+            nodes[node] = res
+        return cls(nodes[0])
+
+    def to_arrays(self) -> tuple[list[str], array, array, array, array]:
+        """Flatten Trie into arrays with nodes numbered breadth first
+
+        Returns labels, first child node, label index, count and icann flag
+        (1 for ICANN, 0 for PRIVATE and -1 for none) per node, with node 0 as
+        root. The children of node n are first_child[n] to first_child[n + 1] - 1.
+        """
+        label_index: dict[str, int] = {}
+        first_child = array("I")
+        label = array("I", [0])
+        count = array("B", [0])
+        icann = array("b", [-1])
+        nodes = [self.root]
+        for children in nodes:
+            first_child.append(len(nodes))
+            for key, (grandchildren, flag, cnt) in children.items():
+                nodes.append(grandchildren)
+                label.append(label_index.setdefault(key, len(label_index)))
+                count.append(cnt)
+                icann.append(-1 if flag is None else int(flag))
+        first_child.append(len(nodes))
+        return list(label_index), first_child, label, count, icann
+
+    def encode_labels(self) -> "CompiledTrie":
+        """Return copy of Trie with ASCII bytes labels, for wire format lookups"""
+        labels: dict[str, bytes] = {}
+        leaf_children: dict = {}
+        leaves: dict[tuple[bool | None, int], Edge] = {}
+
+        def encode_node(children: dict[str, Edge]) -> dict:
+            res = {}
+            for key, (grandchildren, icann, count) in children.items():
+                if grandchildren:
+                    edge = (encode_node(grandchildren), icann, count)
+                else:
+                    edge = leaves.setdefault((icann, count), (leaf_children, icann, count))
+                if (label := labels.get(key)) is None:
+                    label = labels[key] = key.encode()
+                res[label] = edge
+            return res
+
+        return CompiledTrie(encode_node(self.root))
+
+    def search(self, key: Iterable[str]) -> tuple[int, int]:
+        """Search Trie, same results as Trie.search()"""
+        core = 0
+        pcore = 0
+        count = 0
+        children = self.root
+        for label in key:
+            edge = children.get(label)
+            if edge is None:
+                if count != 0:
+                    break
+                raise KeyError
+            children, icann, count = edge
+            if icann is True:
+                core = count
+            elif icann is False:
+                pcore = count
+        if pcore == core:
+            pcore = 0
+        return (core, pcore)
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class DomainCache:
+    """Bounded cache of lookup results, including unknown domains
+
+    Evicts the least recently used (lru) or the oldest inserted (fifo)
+    entry when full. Hits and misses are counted for tuning the size.
+    """
+
+    POLICIES = ("lru", "fifo")
+
+    def __init__(self, maxsize: int, policy: str = "lru") -> None:
+        if maxsize <= 0:
+            raise ValueError(f"Invalid cache size: {maxsize}")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Invalid cache policy: {policy}")
+        self.maxsize = maxsize
+        self.lru = policy == "lru"
+        self.data: OrderedDict[str, tuple[str, str] | None] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: str, func: Callable[[str], tuple[str, str]]) -> tuple[str, str]:
+        """Return cached func(key), KeyError from func is cached as well"""
+        data = self.data
+        try:
+            res = data.pop(key) if self.lru else data[key]
+        except KeyError:
+            self.misses += 1
+            try:
+                res = func(key)
+            except KeyError:
+                res = None
+            data[key] = res
+            if len(data) > self.maxsize:
+                with suppress(KeyError):
+                    # Emptied by a concurrent clear()
+                    data.popitem(last=False)
+        else:
+            self.hits += 1
+            if self.lru:
+                # Reinsert as most recently used
+                data[key] = res
+        if res is None:
+            raise KeyError(key)
+        return res
+
+    def clear(self) -> None:
+        # Replace rather than clear, so lookups in flight only touch the old data
+        self.data = OrderedDict()
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.data))
+
+
 class PublicSuffixList:
-    """Mozilla Public Suffix List"""
+    """Mozilla Public Suffix List
 
-    def __init__(self) -> None:
-        self.trie = Trie()
-
-    def load_psl_url(self, url: str) -> None:
-        """Load PSL from URL"""
-        response = httpx.get(
-            url,
-            headers={
-                "Accept-Encoding": "gzip",
-            },
-        )
-        response.raise_for_status()
-        self.load_psl(io.StringIO(response.text))
+    Every load_psl() call builds a new trie, and the copy used for wire
+    format lookups, and then swaps them in, so lookups running
+    concurrently see either the old or the new list.
+    With compiled=True, lookups use a CompiledTrie. With cache_size set,
+    coredomain() results are kept in a DomainCache that is cleared on
+    every load.
+    """
+
+    def __init__(self, compiled: bool = False, cache_size: int = 0, cache_policy: str = "lru") -> None:
+        self.compiled = compiled
+        self.trie: Trie | CompiledTrie = Trie()
+        self.checksum: bytes | None = None
+        self.cache = DomainCache(maxsize=cache_size, policy=cache_policy) if cache_size else None
+        self.url: str | None = None
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self._wire_trie = CompiledTrie.from_trie(self.trie).encode_labels()
+
+    def load_psl_url(self, url: str) -> bool:
+        """Load PSL from URL, returns False if not modified since last load"""
+        headers = {
+            "Accept-Encoding": "gzip",
+        }
+        if url == self.url:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+        with httpx.stream("GET", url, headers=headers) as response:
+            if response.status_code == httpx.codes.NOT_MODIFIED:
+                logger.debug("PSL at %s not modified", url)
+                return False
+            response.raise_for_status()
+            # Decompress and parse as the body arrives
+            self.load_psl(_iter_lines(response.iter_bytes()))
+        self.url = url
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        return True
 
-    def load_psl(self, stream: io.StringIO) -> None:
-        """Load PSL from stream"""
+    def load_psl(self, stream: str | os.PathLike | Iterable[str] | Iterable[bytes]) -> None:
+        """Load PSL from file path or from text or binary stream of lines"""
+        if isinstance(stream, str | os.PathLike):
+            with open(stream, "rb") as fp:
+                return self.load_psl(fp)
+        trie = Trie()
+        checksum = hashlib.sha256()
         icann = False
         for line in stream:
+            if isinstance(line, bytes):
+                checksum.update(line)
+                line = line.decode()
+            else:
+                checksum.update(line.encode())
             line = line.rstrip()
 
             if "===BEGIN ICANN DOMAINS===" in line:
@@ -101,7 +422,7 @@ class PublicSuffixList:
                 continue
 
             # Set number of labels in core domain
-            labels = len(line.split(".")) + 1
+            labels = line.count(".") + 2
 
             # Wildcards
             if line[0] == "*":
@@ -112,14 +433,74 @@ class PublicSuffixList:
                 line = line[1:]
                 labels -= 2
 
-            # Convert from Unicode
-            lbls = line.encode("idna").decode().split(".")
+            # Convert from Unicode, ASCII rules are already in IDNA form
+            lbls = (line if line.isascii() else line.encode("idna").decode()).split(".")
 
             # Store reversed
             lbls.reverse()
 
             # Insert into Trie
-            self.trie.insert(lbls, labels, icann)
+            trie.insert(lbls, labels, icann)
+
+        # Swap in the new trie before clearing the cache, so no result from the old list survives
+        self._swap_trie(CompiledTrie.from_trie(trie) if self.compiled else trie)
+        self.checksum = checksum.digest()
+        if self.cache is not None:
+            self.cache.clear()
+
+    def cache_info(self) -> CacheInfo | None:
+        """Return coredomain() cache statistics, or None if caching is disabled"""
+        return self.cache.info() if self.cache is not None else None
+
+    def save_snapshot(self, path: str | os.PathLike) -> None:
+        """Save parsed PSL as fast-load binary snapshot, see from_snapshot()"""
+        trie = self.trie if isinstance(self.trie, CompiledTrie) else CompiledTrie.from_trie(self.trie)
+        labels, first_child, label, count, icann = trie.to_arrays()
+        if sys.byteorder != "little":
+            first_child.byteswap()
+            label.byteswap()
+        labels_blob = "\n".join(labels).encode()
+        padding = b"\x00" * (-len(labels_blob) % 4)
+        payload = b"".join(
+            [labels_blob, padding, first_child.tobytes(), label.tobytes(), count.tobytes(), icann.tobytes()]
+        )
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            len(label),
+            len(labels_blob),
+            zlib.crc32(payload),
+            self.checksum or bytes(32),
+        )
+        # Write to a temporary file and rename, so concurrent readers never see a partial snapshot
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as fp:
+                fp.write(header)
+                fp.write(payload)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    @classmethod
+    def from_snapshot(
+        cls, path: str | os.PathLike, checksum: bytes | None = None, cache_size: int = 0, cache_policy: str = "lru"
+    ) -> Self:
+        """Load PSL from fast-load snapshot written by save_snapshot()
+
+        The snapshot is read into memory and the compiled trie is built
+        straight from its arrays, which is much faster than parsing the list.
+        Each process loading it gets a private copy of the trie. If checksum
+        is given, it must match the SHA-256 of the list the snapshot was
+        created from.
+        """
+        trie, source_checksum = _read_snapshot(Path(path).read_bytes(), checksum)
+
+        psl = cls(compiled=True, cache_size=cache_size, cache_policy=cache_policy)
+        psl._swap_trie(trie)
+        psl.checksum = source_checksum if any(source_checksum) else None
+        return psl
 
     def coredomain(self, domain: str) -> tuple[str, str]:
         """Find ICANN and private name cut-off for domain"""
@@ -129,6 +510,11 @@ class PublicSuffixList:
             domain = domain.rstrip(".")
         except AttributeError as exc:
             raise ValueError from exc
+        if self.cache is not None:
+            return self.cache.lookup(domain, self._coredomain)
+        return self._coredomain(domain)
+
+    def _coredomain(self, domain: str) -> tuple[str, str]:
         lbls = domain.split(".")
         lbls.reverse()
 
@@ -149,8 +535,300 @@ class PublicSuffixList:
 
         return (core_txt, pcore_txt)
 
+    def _swap_trie(self, trie: Trie | CompiledTrie) -> None:
+        """Swap in trie together with its bytes labels copy for wire format lookups"""
+        compiled = trie if isinstance(trie, CompiledTrie) else CompiledTrie.from_trie(trie)
+        wire_trie = compiled.encode_labels()
+        self.trie, self._wire_trie = trie, wire_trie
+
+    def coredomain_wire(self, name: bytes | bytearray | memoryview) -> tuple[int | None, int | None]:
+        """Find ICANN and private name cut-off for an uncompressed wire format name
+
+        Returns the offsets in name where the core and private core domains
+        start (so name[offset:] is the cut-off domain in wire format), or None
+        if there is no such cut-off. Labels are compared case-insensitively.
+        """
+        folded = bytes(name[: MAX_NAME_LENGTH + 1]).lower()
+        end = len(folded)
+        offsets = []
+        labels = []
+        offset = 0
+        while True:
+            if offset >= end:
+                raise ValueError("Invalid wire format name")
+            if not (length := folded[offset]):
+                break
+            if length > MAX_LABEL_LENGTH:
+                raise ValueError("Invalid wire format name")
+            offsets.append(offset)
+            offset += length + 1
+            labels.append(folded[offset - length : offset])
+        if not labels or offset + 1 > MAX_NAME_LENGTH:
+            raise ValueError("Invalid wire format name")
+
+        labels.reverse()
+        c, p = self._wire_trie.search(labels)
+        nlabels = len(offsets)
+        return (
+            offsets[max(nlabels - c, 0)] if c else None,
+            offsets[max(nlabels - p, 0)] if p else None,
+        )
+
+    def coredomain_labels(self, labels: Sequence[bytes]) -> tuple[int | None, int | None]:
+        """Find ICANN and private name cut-off for a sequence of bytes labels
+
+        Labels are in DNS order, optionally ending with the empty root label.
+        Returns the indexes of the first label of the core and private core
+        domains, or None if there is no such cut-off.
+        """
+        nlabels = len(labels)
+        if nlabels and not labels[-1]:
+            nlabels -= 1
+        if not nlabels:
+            raise ValueError("Empty name")
+        c, p = self._wire_trie.search(labels[n].lower() for n in range(nlabels - 1, -1, -1))
+        return (max(nlabels - c, 0) if c else None, max(nlabels - p, 0) if p else None)
+
     def rdomain(self, rdomain: str) -> tuple[str, str]:
         """Find ICANN and private name cut-off for domain, reverse order process"""
         lbls = rdomain.split(".")
         c, p = self.trie.search(lbls)
         return (".".join(lbls[0:c]), ".".join(lbls[0:p]))
+
+    def coredomain_many(self, domains: Iterable[str]) -> tuple[list[str | None], list[str | None]]:
+        """Find ICANN and private name cut-off for many domains
+
+        Accepts lists, generators and NumPy/Arrow string arrays. Returns the
+        core and private core columns in input order, with None for names that
+        are invalid or not covered by the list. Repeated names are only looked
+        up once per batch.
+        """
+        names = _as_list(domains)
+        search = self.trie.search
+        core: dict[str, str | None] = {}
+        pcore: dict[str, str | None] = {}
+        for domain in dict.fromkeys(names):
+            try:
+                lbls = domain.rstrip(".").split(".")
+                c, p = search(lbls[::-1])
+            except (AttributeError, KeyError):
+                core[domain] = pcore[domain] = None
+                continue
+            core[domain] = ".".join(lbls[-c:]) + "." if c else ""
+            pcore[domain] = ".".join(lbls[-p:]) + "." if p else ""
+        return list(map(core.__getitem__, names)), list(map(pcore.__getitem__, names))
+
+    def rdomain_many(self, rdomains: Iterable[str]) -> tuple[list[str | None], list[str | None]]:
+        """Find ICANN and private name cut-off for many reversed domains
+
+        Same input and output conventions as coredomain_many().
+        """
+        names = _as_list(rdomains)
+        search = self.trie.search
+        core: dict[str, str | None] = {}
+        pcore: dict[str, str | None] = {}
+        for rdomain in dict.fromkeys(names):
+            try:
+                lbls = rdomain.split(".")
+                c, p = search(lbls)
+            except (AttributeError, KeyError):
+                core[rdomain] = pcore[rdomain] = None
+                continue
+            core[rdomain] = ".".join(lbls[0:c])
+            pcore[rdomain] = ".".join(lbls[0:p])
+        return list(map(core.__getitem__, names)), list(map(pcore.__getitem__, names))
+
+
+class PublicSuffixListRefresher:
+    """Keep a PublicSuffixList current from a background thread
+
+    A URL source is fetched every interval seconds using conditional GETs.
+    A file source is checked every interval seconds and reloaded when its
+    modification time changes. The new list is built off to the side while
+    lookups continue on the old one, and a failed reload keeps the old one.
+    """
+
+    def __init__(self, psl: PublicSuffixList, source: str | os.PathLike, interval: float = 3600) -> None:
+        self.psl = psl
+        self.source = os.fspath(source)
+        self.interval = interval
+        self._mtime: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def refresh(self) -> bool:
+        """Reload PSL if changed, returns True if reloaded"""
+        if self.source.startswith("http://") or self.source.startswith("https://"):
+            return self.psl.load_psl_url(self.source)
+        mtime = os.stat(self.source).st_mtime_ns
+        if mtime == self._mtime:
+            return False
+        self.psl.load_psl(self.source)
+        self._mtime = mtime
+        return True
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                if self.refresh():
+                    logger.info("Reloaded PSL from %s", self.source)
+            except Exception:
+                logger.exception("Failed to reload PSL from %s", self.source)
+
+    def start(self) -> None:
+        """Load PSL and start refreshing it in the background"""
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="psl-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+MOZ_PSL = "https://publicsuffix.org/list/public_suffix_list.dat"
+
+# PublicSuffixList of each worker process
+_worker_psl: PublicSuffixList | None = None
+
+
+def _init_worker(snapshot: str) -> None:
+    global _worker_psl
+    _worker_psl = PublicSuffixList.from_snapshot(snapshot)
+
+
+def _coredomain_chunk(names: list[str]) -> tuple[list[str | None], list[str | None]]:
+    assert _worker_psl is not None
+    return _worker_psl.coredomain_many(names)
+
+
+def _read_chunks(files: list[str], chunk_size: int) -> Iterator[list[str]]:
+    """Read names from files ("-" for stdin) in chunks"""
+    chunk = []
+    for filename in files:
+        with (
+            open(sys.stdin.fileno(), encoding="utf-8", errors="replace", closefd=False)
+            if filename == "-"
+            else open(filename, encoding="utf-8", errors="replace")
+        ) as fp:
+            for line in fp:
+                chunk.append(line.strip())
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+
+def _process_chunks(
+    chunks: Iterable[list[str]], snapshot: str, workers: int
+) -> Iterator[tuple[list[str], list[str | None], list[str | None]]]:
+    """Look up chunks on a process pool, yielding results in input order
+
+    At most two chunks per worker are in flight, so memory use is bounded
+    regardless of input size.
+    """
+    if workers <= 1:
+        _init_worker(snapshot)
+        for names in chunks:
+            yield names, *_coredomain_chunk(names)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(snapshot,)) as executor:
+        pending: deque[tuple[list[str], Future]] = deque()
+        for names in chunks:
+            pending.append((names, executor.submit(_coredomain_chunk, names)))
+            if len(pending) >= 2 * workers:
+                names, future = pending.popleft()
+                yield names, *future.result()
+        while pending:
+            names, future = pending.popleft()
+            yield names, *future.result()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Main function"""
+
+    parser = argparse.ArgumentParser(description="Extract core domains using the Public Suffix List")
+
+    parser.add_argument("--psl", default=MOZ_PSL, help="PSL file or URL")
+    parser.add_argument("--snapshot", help="PSL snapshot (see PublicSuffixList.save_snapshot)")
+    parser.add_argument("--format", choices=["tsv", "ndjson", "parquet"], default="tsv", help="Output format")
+    parser.add_argument("--output", help="Output file (default stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Names per chunk")
+    parser.add_argument("--debug", action="store_true", help="Enable debugging")
+    parser.add_argument("files", nargs="*", default=["-"], help="Files with one name per line (default stdin)")
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    if args.format == "parquet":
+        if not args.output:
+            parser.error("Parquet output requires --output")
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            parser.error("Parquet output requires pyarrow")
+
+    with tempfile.TemporaryDirectory(prefix="dnstapir-psl") as directory:
+        # Workers load a snapshot, which is much faster than each parsing the list
+        if args.snapshot:
+            snapshot = args.snapshot
+        else:
+            psl = PublicSuffixList(compiled=True)
+            if args.psl.startswith("http://") or args.psl.startswith("https://"):
+                psl.load_psl_url(args.psl)
+            else:
+                psl.load_psl(args.psl)
+            snapshot = os.path.join(directory, "psl.snapshot")
+            psl.save_snapshot(snapshot)
+            del psl
+
+        results = _process_chunks(_read_chunks(args.files, args.chunk_size), snapshot, args.workers)
+        count = 0
+        t1 = time.perf_counter()
+
+        if args.format == "parquet":
+            schema = pyarrow.schema(
+                [("name", pyarrow.string()), ("core", pyarrow.string()), ("pcore", pyarrow.string())]
+            )
+            with pyarrow.parquet.ParquetWriter(args.output, schema) as writer:
+                for names, core, pcore in results:
+                    writer.write_table(pyarrow.table([names, core, pcore], schema=schema))
+                    count += len(names)
+        else:
+            with (
+                open(args.output, "w", encoding="utf-8")
+                if args.output
+                else open(sys.stdout.fileno(), "w", encoding="utf-8", closefd=False)
+            ) as fp:
+                for names, core, pcore in results:
+                    if args.format == "ndjson":
+                        fp.writelines(
+                            json.dumps({"name": n, "core": c, "pcore": p}) + "\n"
+                            for n, c, p in zip(names, core, pcore, strict=True)
+                        )
+                    else:
+                        fp.writelines(
+                            f"{n}\t{c or ''}\t{p or ''}\n" for n, c, p in zip(names, core, pcore, strict=True)
+                        )
+                    count += len(names)
+
+        elapsed = time.perf_counter() - t1
+        logger.info("Processed %d names in %.1fs (%.0f names/s)", count, elapsed, count / elapsed if elapsed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,317 @@
 import argparse
 import json
 import logging
+import sys
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import islice
 from urllib.parse import urljoin
 
 from jwcrypto.common import JWKeyNotFound
 from jwcrypto.jwk import JWK, JWKSet
 from jwcrypto.jws import JWS, InvalidJWSSignature
+from ttlru_map import TTLMap
 
-from .key_resolver import KeyResolver, UrlKeyResolver
+from .key_cache import MemoryKeyCache
+from .key_resolver import KeyResolver, KeyUnavailableError, UrlKeyResolver
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class VerifyResult:
+    """Result of verifying a single message in a batch"""
+
+    jws: JWS | None = None
+    key: JWK | None = None
+    error: Exception | None = None
+
+    @property
+    def verified(self) -> bool:
+        return self.key is not None
+
+
 class ResolverJWKSet(JWKSet):
-    def __init__(self, key_resolver: KeyResolver):
+    """JWK set resolving keys by kid, keeping up to cache_size keys for cache_ttl seconds
+
+    A key that fails to verify a signature is refreshed at most once every
+    refresh_interval seconds per kid, so forged messages cannot force a key
+    fetch each.
+    """
+
+    def __init__(
+        self,
+        key_resolver: KeyResolver,
+        cache_size: int = 1000,
+        cache_ttl: int = 300,
+        max_workers: int | None = None,
+        refresh_interval: float = 30,
+    ):
         super().__init__()
         self.key_resolver = key_resolver
-        self._cache: dict[str, JWK] = {}
+        self.max_workers = max_workers
+        self.refresh_interval = refresh_interval
+        # Keys are cached with the time they were resolved
+        self._cache: TTLMap[str, tuple[JWK, float]] = TTLMap(ttl=timedelta(seconds=cache_ttl), max_size=cache_size)
+        self._refresh_lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        # Cleared if the resolver predates refresh and only takes a key ID
+        self._resolver_refresh = True
+
+    def get_key(self, kid: str, refresh: bool = False) -> JWK:
+        """Get key by kid, with refresh bypassing all caches
 
-    def get_key(self, kid: str) -> JWK:
-        if kid in self._cache:
-            return self._cache[kid]
-        key = JWK.from_pyca(self.key_resolver.resolve_public_key(kid))  # type: ignore
-        self._cache[kid] = key
+        The cached key is only replaced once a key has been resolved.
+        """
+        if not refresh and (entry := self._cache.get(kid)) is not None:
+            return entry[0]
+        public_key = None
+        if refresh and self._resolver_refresh:
+            try:
+                public_key = self.key_resolver.resolve_public_key(kid, refresh=True)
+            except TypeError:
+                logger.warning("Key resolver does not support refresh, resolving without")
+                self._resolver_refresh = False
+        if public_key is None:
+            public_key = self.key_resolver.resolve_public_key(kid)
+        key = JWK.from_pyca(public_key)  # type: ignore
+        self._cache[kid] = (key, time.monotonic())  # type: ignore
         return key  # type: ignore
 
     def get_keys(self, kid: str) -> list[JWK]:
         return [self.get_key(kid)]
 
+    def invalidate(self, kid: str) -> None:
+        """Drop cached key"""
+        self._cache.pop(kid, None)
+
+    def _claim_refresh(self, kid: str) -> bool:
+        """Return True if cached kid was resolved at least refresh_interval seconds ago
+
+        The resolve time is reset, so concurrent callers do not refresh the same kid.
+        """
+        with self._refresh_lock:
+            entry = self._cache.get(kid)
+            now = time.monotonic()
+            if entry is None or now - entry[1] < self.refresh_interval:
+                return False
+            self._cache[kid] = (entry[0], now)
+            return True
+
     def verify_jws(self, jws: JWS) -> JWK:
-        """Verify JWS and return verified key (or raise JWKeyNotFound)"""
+        """Verify JWS and return verified key (or raise JWKeyNotFound)
+
+        If verification with a cached key fails, the key may have been rotated,
+        so verification is retried once with a freshly resolved key, unless
+        the key was resolved within refresh_interval. If the key source is
+        unavailable, the cached key is kept.
+        """
         protected_header: dict[str, str] = json.loads(jws.objects["protected"])
         if kid := protected_header.get("kid"):
             logger.debug("Signature by kid=%s", kid)
-            for key in self.get_keys(kid):
-                try:
-                    jws.verify(key=key)
-                    if not hasattr(key, "kid"):
-                        key.kid = kid
-                    return key
-                except InvalidJWSSignature:
-                    pass
+            key = self.get_key(kid)
+            if self._verify_with_key(jws, key, kid):
+                return key
+            if self._claim_refresh(kid):
+                logger.debug("Signature by kid=%s not verified by cached key, refreshing", kid)
+                refreshed = self._refresh_key(kid)
+                if refreshed is not None and self._verify_with_key(jws, refreshed, kid):
+                    return refreshed
         else:
             logger.debug("Signature without kid")
         raise JWKeyNotFound
 
+    def verify_many(self, messages: Iterable[str | bytes | JWS]) -> list[VerifyResult]:
+        """Verify many JWS messages, returning one result per message in order
+
+        Each kid is resolved once per batch and signatures are checked on a
+        thread pool. Failures are reported per message and never abort the batch.
+        """
+        results: list[VerifyResult] = []
+        groups: dict[str, list[int]] = {}
+        for index, message in enumerate(messages):
+            result = VerifyResult()
+            results.append(result)
+            try:
+                if isinstance(message, JWS):
+                    jws = message
+                else:
+                    jws = JWS()
+                    jws.deserialize(message)
+                result.jws = jws
+                protected_header: dict[str, str] = json.loads(jws.objects["protected"])
+            except Exception as exc:
+                result.error = exc
+                continue
+            if kid := protected_header.get("kid"):
+                groups.setdefault(kid, []).append(index)
+            else:
+                logger.debug("Signature without kid")
+                result.error = JWKeyNotFound()
+
+        if not groups:
+            return results
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="jws-verify")
+        executor = self._executor
+
+        def resolve(kid: str) -> JWK | Exception:
+            try:
+                return self.get_key(kid)
+            except Exception as exc:
+                return exc
+
+        def verify(keys: dict[str, JWK | Exception], groups: dict[str, list[int]]) -> dict[str, list[int]]:
+            """Verify messages with resolved keys, returning indexes of messages not verified per kid"""
+            # Submit checks for all kids before waiting for any
+            futures: dict[str, list[tuple[int, Future]]] = {}
+            failures: dict[str, list[int]] = {}
+            for kid, indexes in groups.items():
+                failures[kid] = []
+                if isinstance(key := keys[kid], Exception):
+                    for index in indexes:
+                        results[index].error = key
+                    continue
+                futures[kid] = [
+                    (index, executor.submit(self._verify_with_key, results[index].jws, key, kid)) for index in indexes
+                ]
+            for kid, kid_futures in futures.items():
+                for index, future in kid_futures:
+                    try:
+                        verified = future.result()
+                    except Exception as exc:
+                        results[index].error = exc
+                        continue
+                    if verified:
+                        results[index].key = keys[kid]  # type: ignore
+                    else:
+                        failures[kid].append(index)
+            return failures
+
+        # Resolve each kid once, concurrently
+        keys = dict(zip(groups, executor.map(resolve, groups), strict=True))
+        failures = verify(keys, groups)
 
-def main() -> None:
+        # Retry once with a freshly resolved key if a cached key did not verify
+        retries = {kid: indexes for kid, indexes in failures.items() if indexes and self._claim_refresh(kid)}
+        for kid in retries:
+            logger.debug("Signatures by kid=%s not verified by cached key, refreshing", kid)
+        refreshed = {
+            kid: key
+            for kid, key in zip(retries, executor.map(self._refresh_key, retries), strict=True)
+            if key is not None
+        }
+        failures.update(verify(refreshed, {kid: retries[kid] for kid in refreshed}))
+
+        for indexes in failures.values():
+            for index in indexes:
+                results[index].error = JWKeyNotFound()
+
+        return results
+
+    def _refresh_key(self, kid: str) -> JWK | None:
+        """Resolve kid bypassing all caches, returning None if it could not be resolved
+
+        The cached key is kept unless the key source no longer knows the kid.
+        """
+        try:
+            return self.get_key(kid, refresh=True)
+        except KeyError as exc:
+            if not isinstance(exc, KeyUnavailableError):
+                logger.debug("Key for kid=%s no longer exists", kid)
+                self.invalidate(kid)
+                return None
+            logger.warning("Failed to refresh key for kid=%s, keeping cached key: %s", kid, exc)
+        except Exception as exc:
+            logger.warning("Failed to refresh key for kid=%s, keeping cached key: %s", kid, exc)
+        return None
+
+    @staticmethod
+    def _verify_with_key(jws: JWS, key: JWK, kid: str) -> bool:
+        try:
+            jws.verify(key=key)
+        except InvalidJWSSignature:
+            return False
+        if not hasattr(key, "kid"):
+            key.kid = kid
+        return True
+
+
+def _read_messages(files: list[str]) -> Iterator[tuple[str, int, str]]:
+    """Read compact JWS messages, one per line, from files ("-" for stdin)"""
+    for filename in files:
+        with open(sys.stdin.fileno(), closefd=False) if filename == "-" else open(filename) as fp:
+            for lineno, line in enumerate(fp, start=1):
+                if message := line.strip():
+                    yield filename, lineno, message
+
+
+def _batch_result(filename: str, lineno: int, result: VerifyResult, with_payload: bool) -> dict:
+    res: dict = {"source": filename, "line": lineno, "verified": result.verified, "kid": None}
+    if result.jws is not None:
+        with suppress(Exception):
+            res["kid"] = json.loads(result.jws.objects["protected"]).get("kid")
+    if result.error is not None:
+        res["error"] = f"{result.error.__class__.__name__}: {result.error}"
+    if with_payload and result.verified:
+        res["payload"] = result.jws.payload.decode(errors="replace")  # type: ignore
+    return res
+
+
+def verify_batch(keyset: ResolverJWKSet, files: list[str], batch_size: int, with_payload: bool = False) -> bool:
+    """Verify messages from files, writing one JSON result per line to stdout
+
+    Messages are verified batch_size at a time with ResolverJWKSet.verify_many(),
+    with keys cached across batches. Returns True if all messages were verified.
+    """
+    messages = verified = 0
+    t1 = time.perf_counter()
+    lines = _read_messages(files)
+    while batch := list(islice(lines, batch_size)):
+        results = keyset.verify_many(message for _, _, message in batch)
+        for (filename, lineno, _), result in zip(batch, results, strict=True):
+            print(json.dumps(_batch_result(filename, lineno, result, with_payload)))
+            verified += result.verified
+        messages += len(batch)
+    elapsed = time.perf_counter() - t1
+    logger.info(
+        "Verified %d of %d messages in %.3fs (%.0f messages/s)",
+        verified,
+        messages,
+        elapsed,
+        messages / elapsed if elapsed else 0,
+    )
+    return verified == messages
+
+
+def main(argv: list[str] | None = None) -> None:
     """Main function"""
 
     parser = argparse.ArgumentParser(description="JWS Verifier")
 
     parser.add_argument("--nodeman", help="Nodeman API")
     parser.add_argument("--debug", action="store_true", help="Enable debugging")
-    parser.add_argument("message", help="JWS message")
+    parser.add_argument(
+        "--batch", metavar="FILE", action="append", help='Verify messages, one per line, from FILE ("-" for stdin)'
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="Messages verified together in batch mode")
+    parser.add_argument("--workers", type=int, help="Verification threads in batch mode")
+    parser.add_argument("--key-cache-size", type=int, default=10000, help="Key cache size in batch mode")
+    parser.add_argument("--key-cache-ttl", type=int, default=300, help="Key cache TTL in batch mode")
+    parser.add_argument("--negative-ttl", type=int, default=60, help="Unknown key cache TTL in batch mode")
+    parser.add_argument("--payload", action="store_true", help="Include payload in batch results")
+    parser.add_argument("message", nargs="?", help="JWS message")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    if (args.message is None) == (args.batch is None):
+        parser.error("Either a message or --batch is required")
 
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
@@ -64,6 +320,19 @@ def main() -> None:
 
     client_database_base_url = urljoin(args.nodeman, "/api/v1/node/{key_id}/public_key")
 
+    if args.batch:
+        key_cache = MemoryKeyCache(size=args.key_cache_size, ttl=args.key_cache_ttl, negative_ttl=args.negative_ttl)
+        key_resolver = UrlKeyResolver(client_database_base_url=client_database_base_url, key_cache=key_cache)
+        keyset = ResolverJWKSet(
+            key_resolver=key_resolver,
+            cache_size=args.key_cache_size,
+            cache_ttl=args.key_cache_ttl,
+            max_workers=args.workers,
+        )
+        if not verify_batch(keyset, args.batch, batch_size=args.batch_size, with_payload=args.payload):
+            sys.exit(1)
+        return
+
     key_resolver = UrlKeyResolver(client_database_base_url=client_database_base_url)
     keyset = ResolverJWKSet(key_resolver=key_resolver)
 
@@ -1,32 +1,155 @@
+import asyncio
 import logging
+import math
+import secrets
+import threading
 import time
 from abc import abstractmethod
+from collections.abc import Awaitable, Callable, Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from typing import Any, Self, TypeVar
 
 import redis
+import redis.asyncio
+import redis.cluster
+import redis.sentinel
 from opentelemetry import trace
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from ttlru_map import TTLMap
 
 tracer = trace.get_tracer("dnstapir.tracer")
 
+T = TypeVar("T")
+
 
 class RedisSettings(BaseModel):
-    host: str = Field(description="Redis hostname")
+    host: str | None = Field(description="Redis hostname (or cluster seed node)", default=None)
     port: int = Field(description="Redis port", default=6379)
+    unix_socket_path: str | None = Field(description="Redis Unix socket path", default=None)
+    db: int = Field(description="Redis database", default=0)
+    username: str | None = Field(description="Redis username", default=None)
+    password: str | None = Field(description="Redis password", default=None)
+    max_connections: int | None = Field(description="Connection pool size", default=None)
+    socket_timeout: float | None = Field(description="Socket timeout (seconds)", default=1.0)
+    socket_connect_timeout: float | None = Field(description="Socket connect timeout (seconds)", default=1.0)
+    sentinels: list[tuple[str, int]] | None = Field(description="Sentinel hosts and ports", default=None)
+    sentinel_service_name: str = Field(description="Sentinel service name", default="mymaster")
+    sentinel_username: str | None = Field(description="Sentinel username", default=None)
+    sentinel_password: str | None = Field(description="Sentinel password", default=None)
+    cluster: bool = Field(description="Connect to Redis Cluster", default=False)
+    circuit_breaker_threshold: int = Field(
+        description="Consecutive failures before treating Redis as down (0 to disable)", default=5
+    )
+    circuit_breaker_reset: float = Field(description="Seconds before retrying Redis once down", default=30)
+
+    @model_validator(mode="after")
+    def check_endpoint(self) -> Self:
+        if not (self.host or self.unix_socket_path or self.sentinels):
+            raise ValueError("One of host, unix_socket_path or sentinels is required")
+        if self.cluster and not self.host:
+            raise ValueError("Cluster requires host")
+        return self
+
+    def connection_kwargs(self) -> dict[str, Any]:
+        return {
+            "db": self.db,
+            "username": self.username,
+            "password": self.password,
+            "socket_timeout": self.socket_timeout,
+            "socket_connect_timeout": self.socket_connect_timeout,
+        }
+
+    def sentinel_kwargs(self) -> dict[str, Any]:
+        """Connection arguments for Sentinels, which do not share the master's database or credentials"""
+        return {
+            "username": self.sentinel_username,
+            "password": self.sentinel_password,
+            "socket_timeout": self.socket_timeout,
+            "socket_connect_timeout": self.socket_connect_timeout,
+        }
 
 
 class KeyCacheSettings(BaseModel):
     size: int = Field(description="Cache size", default=1000)
     ttl: int = Field(description="Cache TTL", default=300)
+    negative_ttl: int = Field(description="Cache TTL for unknown keys (0 to disable)", default=0)
+    negative_size: int | None = Field(
+        description="Memory cache size for unknown keys (default size / 10)", default=None
+    )
     redis: RedisSettings | None = None
 
 
+def redis_client_from_settings(settings: RedisSettings) -> redis.Redis | redis.cluster.RedisCluster:
+    """Create Redis client for a single server, Sentinel or Cluster"""
+    kwargs = settings.connection_kwargs()
+    if settings.cluster:
+        kwargs.pop("db")
+        if settings.max_connections:
+            kwargs["max_connections"] = settings.max_connections
+        return redis.cluster.RedisCluster(host=settings.host, port=settings.port, **kwargs)
+    if settings.sentinels:
+        sentinel = redis.sentinel.Sentinel(settings.sentinels, sentinel_kwargs=settings.sentinel_kwargs(), **kwargs)
+        return sentinel.master_for(settings.sentinel_service_name, max_connections=settings.max_connections)
+    if settings.unix_socket_path:
+        connection_pool = redis.ConnectionPool(
+            connection_class=redis.UnixDomainSocketConnection,
+            path=settings.unix_socket_path,
+            max_connections=settings.max_connections,
+            **kwargs,
+        )
+    else:
+        connection_pool = redis.ConnectionPool(
+            host=settings.host, port=settings.port, max_connections=settings.max_connections, **kwargs
+        )
+    return redis.StrictRedis(connection_pool=connection_pool)
+
+
+def async_redis_client_from_settings(settings: RedisSettings) -> redis.asyncio.Redis | redis.asyncio.RedisCluster:
+    """Create async Redis client for a single server, Sentinel or Cluster"""
+    kwargs = settings.connection_kwargs()
+    if settings.cluster:
+        kwargs.pop("db")
+        if settings.max_connections:
+            kwargs["max_connections"] = settings.max_connections
+        return redis.asyncio.RedisCluster(host=settings.host, port=settings.port, **kwargs)
+    if settings.sentinels:
+        sentinel = redis.asyncio.Sentinel(settings.sentinels, sentinel_kwargs=settings.sentinel_kwargs(), **kwargs)
+        return sentinel.master_for(settings.sentinel_service_name, max_connections=settings.max_connections)
+    if settings.unix_socket_path:
+        connection_pool = redis.asyncio.ConnectionPool(
+            connection_class=redis.asyncio.UnixDomainSocketConnection,
+            path=settings.unix_socket_path,
+            max_connections=settings.max_connections,
+            **kwargs,
+        )
+    else:
+        connection_pool = redis.asyncio.ConnectionPool(
+            host=settings.host, port=settings.port, max_connections=settings.max_connections, **kwargs
+        )
+    return redis.asyncio.StrictRedis(connection_pool=connection_pool)
+
+
+def circuit_breaker_from_settings(settings: RedisSettings) -> "CircuitBreaker | None":
+    if settings.circuit_breaker_threshold <= 0:
+        return None
+    return CircuitBreaker(threshold=settings.circuit_breaker_threshold, reset_timeout=settings.circuit_breaker_reset)
+
+
 def key_cache_from_settings(settings: KeyCacheSettings):
-    memory_key_cache = MemoryKeyCache(size=settings.size, ttl=settings.ttl)
+    memory_key_cache = MemoryKeyCache(
+        size=settings.size,
+        ttl=settings.ttl,
+        negative_ttl=settings.negative_ttl,
+        negative_size=settings.negative_size,
+    )
     if settings.redis:
-        redis_client = redis.StrictRedis(host=settings.redis.host, port=settings.redis.port)
-        redis_key_cache = RedisKeyCache(redis_client=redis_client, ttl=settings.ttl)
+        redis_key_cache = RedisKeyCache(
+            redis_client=redis_client_from_settings(settings.redis),
+            ttl=settings.ttl,
+            negative_ttl=settings.negative_ttl,
+            circuit_breaker=circuit_breaker_from_settings(settings.redis),
+        )
         return CombinedKeyCache([memory_key_cache, redis_key_cache]) if settings.size else redis_key_cache
     elif settings.size:
         return memory_key_cache
@@ -34,16 +157,117 @@ def key_cache_from_settings(settings: KeyCacheSettings):
         return DummyKeyCache()
 
 
+class CircuitBreaker:
+    """Circuit breaker for a remote cache
+
+    After threshold consecutive failures the circuit opens and calls are
+    skipped for reset_timeout seconds, after which a single trial call is
+    let through. A successful call closes the circuit.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30):
+        self.logger = logging.getLogger(__name__).getChild(self.__class__.__name__)
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted"""
+        if self.opened_at is None:
+            return True
+        with self._lock:
+            if self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open, let one trial call through and hold off the rest
+            self.opened_at = time.monotonic()
+            return True
+
+    def success(self) -> None:
+        if self.failures or self.opened_at is not None:
+            with self._lock:
+                if self.opened_at is not None:
+                    self.logger.info("Circuit closed")
+                self.failures = 0
+                self.opened_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    self.logger.warning("Circuit opened after %d failures", self.failures)
+                self.opened_at = time.monotonic()
+
+
+# Cached value marking a key as known not to exist
+NEGATIVE = b""
+
+# Prefix of lease keys (not valid in key IDs)
+LEASE_PREFIX = "lease:"
+
+
 class KeyCache:
-    def __init__(self):
+    """Key cache
+
+    Unknown keys may be cached as NEGATIVE for negative_ttl seconds, so
+    values must be compared against None (not for truthiness) to detect misses.
+    """
+
+    def __init__(self, negative_ttl: int = 0):
         self.logger = logging.getLogger(__name__).getChild(self.__class__.__name__)
+        self.negative_ttl = negative_ttl
 
     @abstractmethod
     def get(self, key: str) -> bytes | None:
         return None
 
+    def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
+        """Get value and its remaining TTL in seconds (None if unknown)"""
+        return self.get(key), None
+
     @abstractmethod
-    def set(self, key: str, value: bytes) -> None:
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        """Set value, expiring after ttl seconds (default and maximum is the cache TTL)"""
+        pass
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        """Get values for many keys, returning only those found"""
+        return {key: res for key, (res, _) in self.get_many_with_ttl(keys).items()}
+
+    def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        """Get values and remaining TTLs for many keys, returning only those found"""
+        res = {}
+        for key in keys:
+            value, ttl = self.get_with_ttl(key)
+            if value is not None:
+                res[key] = (value, ttl)
+        return res
+
+    def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
+        """Set many values, expiring after ttl seconds"""
+        for key, value in items.items():
+            self.set(key, value, ttl=ttl)
+
+    def set_negative(self, key: str) -> None:
+        """Remember key as unknown for negative_ttl seconds (if enabled)"""
+        if self.negative_ttl > 0:
+            self.set(key, NEGATIVE, ttl=self.negative_ttl)
+
+    def acquire_lease(self, key: str, ttl: float) -> bytes | None:
+        """Try to lease fetching key for ttl seconds, returning a token or None if leased elsewhere
+
+        Caches not shared between processes always grant the lease.
+        """
+        return secrets.token_bytes(16)
+
+    def release_lease(self, key: str, token: bytes) -> None:
+        """Release lease, unless it has expired and been acquired by someone else"""
         pass
 
 
@@ -51,58 +275,568 @@ class DummyKeyCache(KeyCache):
     def get(self, key: str) -> bytes | None:
         return None
 
-    def set(self, key: str, value: bytes) -> None:
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        pass
+
+    def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        return {}
+
+    def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
         pass
 
 
 class MemoryKeyCache(KeyCache):
-    def __init__(self, size: int, ttl: int):
-        super().__init__()
-        self.cache = TTLMap(ttl=timedelta(seconds=ttl), max_size=size)
-        self.logger.info("Configured memory key cache size=%d ttl=%d", size, ttl)
+    """In-memory key cache
+
+    Unknown keys are kept in a separate map of negative_size entries (by
+    default a tenth of size), so a flood of unknown keys never evicts known
+    keys.
+    """
+
+    def __init__(self, size: int, ttl: int, negative_ttl: int = 0, negative_size: int | None = None):
+        super().__init__(negative_ttl=negative_ttl)
+        self.ttl = ttl
+        # Values are stored with their expiry time, to support shorter TTLs per entry
+        self.cache: TTLMap[str, tuple[bytes, float]] = TTLMap(ttl=timedelta(seconds=ttl), max_size=size)
+        negative_size = max(1, size // 10) if negative_size is None else negative_size
+        self.negative_cache: TTLMap[str, float] = TTLMap(
+            ttl=timedelta(seconds=max(negative_ttl, 1)), max_size=negative_size
+        )
+        self.logger.info(
+            "Configured memory key cache size=%d ttl=%d negative_ttl=%d negative_size=%d",
+            size,
+            ttl,
+            negative_ttl,
+            negative_size,
+        )
 
     def get(self, key: str) -> bytes | None:
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
         with tracer.start_as_current_span("memory_key_cache_get"):
-            res = self.cache.get(key)
-        self.logger.debug("Cache GET %s (%s)", key, "hit" if res else "miss")
-        return res
+            entry = self.cache.get(key)
+            if entry is None and (negative_expires_at := self.negative_cache.get(key)) is not None:
+                entry = (NEGATIVE, negative_expires_at)
+        res, ttl = None, None
+        if entry is not None and (remaining := entry[1] - time.time()) > 0:
+            res, ttl = entry[0], remaining
+        self.logger.debug("Cache GET %s (%s)", key, "hit" if res is not None else "miss")
+        return res, ttl
 
-    def set(self, key: str, value: bytes) -> None:
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
         self.logger.debug("Cache SET %s", key)
+        expires_at = time.time() + (self.ttl if ttl is None else min(ttl, self.ttl))
         with tracer.start_as_current_span("memory_key_cache_set"):
-            self.cache[key] = value
+            if value == NEGATIVE:
+                self.cache.pop(key, None)
+                self.negative_cache[key] = expires_at
+            else:
+                self.negative_cache.pop(key, None)
+                self.cache[key] = (value, expires_at)
 
 
 class RedisKeyCache(KeyCache):
-    def __init__(self, redis_client: redis.Redis, ttl: int):
-        super().__init__()
+    """Redis key cache
+
+    With a circuit breaker, Redis errors are logged and treated as cache
+    misses (and dropped writes) instead of failing the lookup.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis | redis.cluster.RedisCluster,
+        ttl: int,
+        negative_ttl: int = 0,
+        circuit_breaker: CircuitBreaker | None = None,
+    ):
+        super().__init__(negative_ttl=negative_ttl)
         self.redis_client = redis_client
         self.ttl = ttl
-        self.logger.info("Configured Redis key cache ttl=%d", ttl)
+        self.circuit_breaker = circuit_breaker
+        # Keys of a batch may live on different cluster nodes, so no MGET
+        self.cluster = isinstance(redis_client, redis.cluster.RedisCluster)
+        self.logger.info("Configured Redis key cache ttl=%d negative_ttl=%d", ttl, negative_ttl)
+
+    def _guarded(self, func: Callable[[], T], default: T) -> T:
+        if self.circuit_breaker is None:
+            return func()
+        if not self.circuit_breaker.allow():
+            return default
+        try:
+            res = func()
+        except redis.RedisError as exc:
+            self.logger.warning("Redis unavailable: %s", exc)
+            self.circuit_breaker.failure()
+            return default
+        self.circuit_breaker.success()
+        return res
 
     def get(self, key: str) -> bytes | None:
         with tracer.start_as_current_span("redis_key_cache_get"):
-            res = self.redis_client.get(name=key)
-        self.logger.debug("Cache GET %s (%s)", key, "hit" if res else "miss")
+            res = self._guarded(lambda: self.redis_client.get(name=key), None)
+        self.logger.debug("Cache GET %s (%s)", key, "hit" if res is not None else "miss")
         return res
 
-    def set(self, key: str, value: bytes) -> None:
+    def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
+        def get_with_pttl() -> list:
+            # GET and PTTL in a single round trip
+            pipeline = self.redis_client.pipeline(transaction=False)
+            pipeline.get(name=key)
+            pipeline.pttl(name=key)
+            return pipeline.execute()
+
+        with tracer.start_as_current_span("redis_key_cache_get"):
+            res, pttl = self._guarded(get_with_pttl, [None, -2])
+        self.logger.debug("Cache GET %s (%s)", key, "hit" if res is not None else "miss")
+        # PTTL is negative for keys without expiry
+        return res, pttl / 1000 if res is not None and pttl >= 0 else None
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
         self.logger.debug("Cache SET %s", key)
-        expires_at = int(time.time()) + self.ttl
+        expires_at = self._expires_at(ttl)
         with tracer.start_as_current_span("redis_key_cache_set"):
-            self.redis_client.set(name=key, value=value, exat=expires_at)
+            self._guarded(lambda: self.redis_client.set(name=key, value=value, exat=expires_at), None)
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        if self.cluster:
+            return super().get_many(keys)
+        with tracer.start_as_current_span("redis_key_cache_get_many"):
+            values = self._guarded(lambda: self.redis_client.mget(keys), [None] * len(keys))
+        self.logger.debug("Cache MGET %d keys (%d hits)", len(keys), sum(1 for value in values if value is not None))
+        return {key: value for key, value in zip(keys, values, strict=True) if value is not None}
+
+    def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        def get_many_with_pttl() -> tuple[list, list]:
+            # All values and PTTLs in a single round trip
+            pipeline = self.redis_client.pipeline(transaction=False)
+            if self.cluster:
+                for key in keys:
+                    pipeline.get(name=key)
+            else:
+                pipeline.mget(keys)
+            for key in keys:
+                pipeline.pttl(name=key)
+            res = pipeline.execute()
+            if self.cluster:
+                return res[: len(keys)], res[len(keys) :]
+            return res[0], res[1:]
+
+        with tracer.start_as_current_span("redis_key_cache_get_many"):
+            values, pttls = self._guarded(get_many_with_pttl, ([None] * len(keys), [-2] * len(keys)))
+        self.logger.debug("Cache MGET %d keys (%d hits)", len(keys), sum(1 for value in values if value is not None))
+        return {
+            key: (value, pttl / 1000 if pttl >= 0 else None)
+            for key, value, pttl in zip(keys, values, pttls, strict=True)
+            if value is not None
+        }
+
+    def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
+        if not items:
+            return
+        self.logger.debug("Cache SET %d keys", len(items))
+        expires_at = self._expires_at(ttl)
+
+        def set_many() -> None:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipeline.set(name=key, value=value, exat=expires_at)
+            pipeline.execute()
+
+        with tracer.start_as_current_span("redis_key_cache_set_many"):
+            self._guarded(set_many, None)
+
+    def acquire_lease(self, key: str, ttl: float) -> bytes | None:
+        token = secrets.token_bytes(16)
+        # If Redis is down, everyone gets the lease
+        acquired = self._guarded(
+            lambda: self.redis_client.set(name=LEASE_PREFIX + key, value=token, nx=True, px=math.ceil(ttl * 1000)),
+            True,
+        )
+        self.logger.debug("Cache LEASE %s (%s)", key, "acquired" if acquired else "held")
+        return token if acquired else None
+
+    def release_lease(self, key: str, token: bytes) -> None:
+        name = LEASE_PREFIX + key
+
+        def release() -> None:
+            if self.cluster:
+                if self.redis_client.get(name=name) == token:
+                    self.redis_client.delete(name)
+                return
+            # Compare and delete, without relying on Lua scripting
+            with self.redis_client.pipeline(transaction=True) as pipeline:
+                try:
+                    pipeline.watch(name)
+                    if pipeline.get(name) == token:
+                        pipeline.multi()
+                        pipeline.delete(name)
+                        pipeline.execute()
+                    else:
+                        pipeline.unwatch()
+                except redis.WatchError:
+                    pass
+
+        self._guarded(release, None)
+
+    def _expires_at(self, ttl: float | None) -> int:
+        return math.ceil(time.time() + (self.ttl if ttl is None else min(ttl, self.ttl)))
 
 
 class CombinedKeyCache(KeyCache):
+    """Tiered key cache, fastest first
+
+    A hit in a slower tier is written back into all faster tiers with the
+    remaining TTL. Writes to the slower tiers run concurrently.
+    """
+
     def __init__(self, caches: list[KeyCache]):
+        super().__init__()
         self.caches = caches
+        self._executor: ThreadPoolExecutor | None = None
 
     def get(self, key: str) -> bytes | None:
-        for cache in self.caches:
-            if res := cache.get(key):
-                return res
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
+        for n, cache in enumerate(self.caches):
+            res, ttl = cache.get_with_ttl(key)
+            if res is not None:
+                if ttl is None or ttl > 0:
+                    for faster_cache in self.caches[:n]:
+                        faster_cache.set(key, res, ttl=ttl)
+                return res, ttl
+        return None, None
+
+    def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        found: dict[str, tuple[bytes, float | None]] = {}
+        missing = list(keys)
+        for n, cache in enumerate(self.caches):
+            if not missing:
+                break
+            # One batch per tier for all keys missing from the faster tiers
+            hits = cache.get_many_with_ttl(missing)
+            for key, (res, ttl) in hits.items():
+                if ttl is None or ttl > 0:
+                    for faster_cache in self.caches[:n]:
+                        faster_cache.set(key, res, ttl=ttl)
+            found.update(hits)
+            missing = [key for key in missing if key not in hits]
+        return found
+
+    def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        self._fan_out(lambda cache: cache.set(key, value, ttl=ttl))
+
+    def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
+        self._fan_out(lambda cache: cache.set_many(items, ttl=ttl))
+
+    def set_negative(self, key: str) -> None:
+        self._fan_out(lambda cache: cache.set_negative(key))
+
+    def acquire_lease(self, key: str, ttl: float) -> bytes | None:
+        # The slowest tier is the one shared between processes
+        return self.caches[-1].acquire_lease(key, ttl)
+
+    def release_lease(self, key: str, token: bytes) -> None:
+        self.caches[-1].release_lease(key, token)
+
+    def _fan_out(self, func: Callable[[KeyCache], None]) -> None:
+        fastest_cache, *slower_caches = self.caches
+        if len(slower_caches) < 2:
+            for cache in self.caches:
+                func(cache)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(slower_caches), thread_name_prefix="combined-key-cache")
+        futures = [self._executor.submit(func, cache) for cache in slower_caches]
+        func(fastest_cache)
+        for future in futures:
+            future.result()
+
+
+def async_key_cache_from_settings(settings: KeyCacheSettings):
+    memory_key_cache = AsyncMemoryKeyCache(
+        size=settings.size,
+        ttl=settings.ttl,
+        negative_ttl=settings.negative_ttl,
+        negative_size=settings.negative_size,
+    )
+    if settings.redis:
+        redis_key_cache = AsyncRedisKeyCache(
+            redis_client=async_redis_client_from_settings(settings.redis),
+            ttl=settings.ttl,
+            negative_ttl=settings.negative_ttl,
+            circuit_breaker=circuit_breaker_from_settings(settings.redis),
+        )
+        return AsyncCombinedKeyCache([memory_key_cache, redis_key_cache]) if settings.size else redis_key_cache
+    elif settings.size:
+        return memory_key_cache
+    else:
+        return AsyncDummyKeyCache()
+
+
+class AsyncKeyCache:
+    """Async key cache, see KeyCache"""
+
+    def __init__(self, negative_ttl: int = 0):
+        self.logger = logging.getLogger(__name__).getChild(self.__class__.__name__)
+        self.negative_ttl = negative_ttl
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
         return None
 
-    def set(self, key: str, value: bytes) -> None:
-        for cache in self.caches:
-            cache.set(key, value)
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
+        """Get value and its remaining TTL in seconds (None if unknown)"""
+        return await self.get(key), None
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        """Set value, expiring after ttl seconds (default and maximum is the cache TTL)"""
+        pass
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        """Get values for many keys, returning only those found"""
+        return {key: res for key, (res, _) in (await self.get_many_with_ttl(keys)).items()}
+
+    async def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        """Get values and remaining TTLs for many keys, returning only those found"""
+        res = {}
+        for key in keys:
+            value, ttl = await self.get_with_ttl(key)
+            if value is not None:
+                res[key] = (value, ttl)
+        return res
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
+        """Set many values, expiring after ttl seconds"""
+        for key, value in items.items():
+            await self.set(key, value, ttl=ttl)
+
+    async def set_negative(self, key: str) -> None:
+        """Remember key as unknown for negative_ttl seconds (if enabled)"""
+        if self.negative_ttl > 0:
+            await self.set(key, NEGATIVE, ttl=self.negative_ttl)
+
+    async def aclose(self) -> None:
+        """Close connections and free resources"""
+        pass
+
+
+class AsyncDummyKeyCache(AsyncKeyCache):
+    async def get(self, key: str) -> bytes | None:
+        return None
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        pass
+
+    async def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        return {}
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
+        pass
+
+
+class AsyncMemoryKeyCache(AsyncKeyCache):
+    """Async wrapper around MemoryKeyCache (which never blocks)"""
+
+    def __init__(self, size: int, ttl: int, negative_ttl: int = 0, negative_size: int | None = None):
+        super().__init__(negative_ttl=negative_ttl)
+        self.ttl = ttl
+        self.memory_key_cache = MemoryKeyCache(
+            size=size, ttl=ttl, negative_ttl=negative_ttl, negative_size=negative_size
+        )
+
+    async def get(self, key: str) -> bytes | None:
+        return self.memory_key_cache.get(key)
+
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
+        return self.memory_key_cache.get_with_ttl(key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        self.memory_key_cache.set(key, value, ttl=ttl)
+
+    async def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        return self.memory_key_cache.get_many_with_ttl(keys)
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
+        self.memory_key_cache.set_many(items, ttl=ttl)
+
+
+class AsyncRedisKeyCache(AsyncKeyCache):
+    """Async Redis key cache, see RedisKeyCache"""
+
+    def __init__(
+        self,
+        redis_client: redis.asyncio.Redis | redis.asyncio.RedisCluster,
+        ttl: int,
+        negative_ttl: int = 0,
+        circuit_breaker: CircuitBreaker | None = None,
+    ):
+        super().__init__(negative_ttl=negative_ttl)
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.circuit_breaker = circuit_breaker
+        # Keys of a batch may live on different cluster nodes, so no MGET
+        self.cluster = isinstance(redis_client, redis.asyncio.RedisCluster)
+        self.logger.info("Configured async Redis key cache ttl=%d negative_ttl=%d", ttl, negative_ttl)
+
+    async def _guarded(self, func: Callable[[], Awaitable[T]], default: T) -> T:
+        if self.circuit_breaker is None:
+            return await func()
+        if not self.circuit_breaker.allow():
+            return default
+        try:
+            res = await func()
+        except redis.RedisError as exc:
+            self.logger.warning("Redis unavailable: %s", exc)
+            self.circuit_breaker.failure()
+            return default
+        self.circuit_breaker.success()
+        return res
+
+    async def get(self, key: str) -> bytes | None:
+        with tracer.start_as_current_span("redis_key_cache_get"):
+            res = await self._guarded(lambda: self.redis_client.get(name=key), None)
+        self.logger.debug("Cache GET %s (%s)", key, "hit" if res is not None else "miss")
+        return res
+
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
+        async def get_with_pttl() -> list:
+            # GET and PTTL in a single round trip
+            async with self.redis_client.pipeline(transaction=False) as pipeline:
+                pipeline.get(name=key)
+                pipeline.pttl(name=key)
+                return await pipeline.execute()
+
+        with tracer.start_as_current_span("redis_key_cache_get"):
+            res, pttl = await self._guarded(get_with_pttl, [None, -2])
+        self.logger.debug("Cache GET %s (%s)", key, "hit" if res is not None else "miss")
+        # PTTL is negative for keys without expiry
+        return res, pttl / 1000 if res is not None and pttl >= 0 else None
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        self.logger.debug("Cache SET %s", key)
+        expires_at = self._expires_at(ttl)
+        with tracer.start_as_current_span("redis_key_cache_set"):
+            await self._guarded(lambda: self.redis_client.set(name=key, value=value, exat=expires_at), None)
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        if self.cluster:
+            return await super().get_many(keys)
+        with tracer.start_as_current_span("redis_key_cache_get_many"):
+            values = await self._guarded(lambda: self.redis_client.mget(keys), [None] * len(keys))
+        self.logger.debug("Cache MGET %d keys (%d hits)", len(keys), sum(1 for value in values if value is not None))
+        return {key: value for key, value in zip(keys, values, strict=True) if value is not None}
+
+    async def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        async def get_many_with_pttl() -> tuple[list, list]:
+            # All values and PTTLs in a single round trip
+            async with self.redis_client.pipeline(transaction=False) as pipeline:
+                if self.cluster:
+                    for key in keys:
+                        pipeline.get(name=key)
+                else:
+                    pipeline.mget(keys)
+                for key in keys:
+                    pipeline.pttl(name=key)
+                res = await pipeline.execute()
+            if self.cluster:
+                return res[: len(keys)], res[len(keys) :]
+            return res[0], res[1:]
+
+        with tracer.start_as_current_span("redis_key_cache_get_many"):
+            values, pttls = await self._guarded(get_many_with_pttl, ([None] * len(keys), [-2] * len(keys)))
+        self.logger.debug("Cache MGET %d keys (%d hits)", len(keys), sum(1 for value in values if value is not None))
+        return {
+            key: (value, pttl / 1000 if pttl >= 0 else None)
+            for key, value, pttl in zip(keys, values, pttls, strict=True)
+            if value is not None
+        }
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
+        if not items:
+            return
+        self.logger.debug("Cache SET %d keys", len(items))
+        expires_at = self._expires_at(ttl)
+
+        async def set_many() -> None:
+            async with self.redis_client.pipeline(transaction=False) as pipeline:
+                for key, value in items.items():
+                    pipeline.set(name=key, value=value, exat=expires_at)
+                await pipeline.execute()
+
+        with tracer.start_as_current_span("redis_key_cache_set_many"):
+            await self._guarded(set_many, None)
+
+    async def aclose(self) -> None:
+        await self.redis_client.aclose()
+
+    def _expires_at(self, ttl: float | None) -> int:
+        return math.ceil(time.time() + (self.ttl if ttl is None else min(ttl, self.ttl)))
+
+
+class AsyncCombinedKeyCache(AsyncKeyCache):
+    """Async tiered key cache, fastest first, see CombinedKeyCache
+
+    Writes to all tiers run concurrently.
+    """
+
+    def __init__(self, caches: list[AsyncKeyCache]):
+        super().__init__()
+        self.caches = caches
+
+    async def get(self, key: str) -> bytes | None:
+        return (await self.get_with_ttl(key))[0]
+
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
+        for n, cache in enumerate(self.caches):
+            res, ttl = await cache.get_with_ttl(key)
+            if res is not None:
+                if ttl is None or ttl > 0:
+                    for faster_cache in self.caches[:n]:
+                        await faster_cache.set(key, res, ttl=ttl)
+                return res, ttl
+        return None, None
+
+    async def get_many_with_ttl(self, keys: Iterable[str]) -> dict[str, tuple[bytes, float | None]]:
+        found: dict[str, tuple[bytes, float | None]] = {}
+        missing = list(keys)
+        for n, cache in enumerate(self.caches):
+            if not missing:
+                break
+            # One batch per tier for all keys missing from the faster tiers
+            hits = await cache.get_many_with_ttl(missing)
+            for key, (res, ttl) in hits.items():
+                if ttl is None or ttl > 0:
+                    for faster_cache in self.caches[:n]:
+                        await faster_cache.set(key, res, ttl=ttl)
+            found.update(hits)
+            missing = [key for key in missing if key not in hits]
+        return found
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        await asyncio.gather(*(cache.set(key, value, ttl=ttl) for cache in self.caches))
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float | None = None) -> None:
+        await asyncio.gather(*(cache.set_many(items, ttl=ttl) for cache in self.caches))
+
+    async def set_negative(self, key: str) -> None:
+        await asyncio.gather(*(cache.set_negative(key) for cache in self.caches))
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(cache.aclose() for cache in self.caches))
@@ -0,0 +1,244 @@
+import ctypes
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+from opentelemetry import trace
+
+tracer = trace.get_tracer("dnstapir.tracer")
+
+KEY_SUFFIX = ".pem"
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _inotify_libc() -> ctypes.CDLL | None:
+    """Return libc if it provides inotify, else None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") and hasattr(libc, "inotify_add_watch") else None
+
+
+class KeyDirectoryIndex:
+    """In-memory index of all PEM keys in a directory
+
+    The index is kept current from a background thread, using inotify where
+    available and otherwise scanning file modification times every
+    poll_interval seconds. Changes to files other than keys (e.g. symlink
+    swaps of Kubernetes mounted secrets) trigger a full rescan.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike,
+        key_id_validator: Callable[[str], object] | None = None,
+        poll_interval: float = 5,
+        use_inotify: bool = True,
+        on_change: Callable[[str], None] | None = None,
+    ):
+        self.logger = logging.getLogger(__name__).getChild(self.__class__.__name__)
+        self.directory = Path(directory)
+        self.key_id_validator = key_id_validator
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.keys: dict[str, bytes] = {}
+        self._stats: dict[str, tuple[int, int]] = {}
+        self._libc = _inotify_libc() if use_inotify else None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup: tuple[int, int] | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._libc is not None else "poll"
+
+    def get(self, key_id: str) -> bytes | None:
+        return self.keys.get(key_id)
+
+    def _key_id(self, filename: str) -> str | None:
+        if not filename.endswith(KEY_SUFFIX):
+            return None
+        key_id = filename.removesuffix(KEY_SUFFIX)
+        if self.key_id_validator is not None and not self.key_id_validator(key_id):
+            return None
+        return key_id
+
+    def scan(self) -> set[str]:
+        """Rescan directory, returning key IDs added, changed or removed"""
+        with tracer.start_as_current_span("key_directory_index_scan"), self._lock:
+            seen = set()
+            changed = set()
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if (key_id := self._key_id(entry.name)) is None:
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    seen.add(key_id)
+                    if self._stats.get(key_id) != (st.st_mtime_ns, st.st_size) and self._load(key_id):
+                        changed.add(key_id)
+            for key_id in self.keys.keys() - seen:
+                self._remove(key_id)
+                changed.add(key_id)
+        self._notify(changed)
+        return changed
+
+    def update(self, filename: str) -> bool:
+        """Reload a single key file, returning True if the index changed"""
+        if (key_id := self._key_id(filename)) is None:
+            return False
+        with self._lock:
+            changed = self._load(key_id)
+        if changed:
+            self._notify({key_id})
+        return changed
+
+    def _load(self, key_id: str) -> bool:
+        filename = self.directory / f"{key_id}{KEY_SUFFIX}"
+        try:
+            with open(filename, "rb") as fp:
+                st = os.fstat(fp.fileno())
+                value = fp.read()
+        except FileNotFoundError:
+            if key_id not in self.keys:
+                return False
+            self._remove(key_id)
+            return True
+        if not value:
+            # Created but not yet written
+            return False
+        self._stats[key_id] = (st.st_mtime_ns, st.st_size)
+        if self.keys.get(key_id) == value:
+            return False
+        self.keys[key_id] = value
+        self.logger.debug("Indexed key %s", key_id)
+        return True
+
+    def _remove(self, key_id: str) -> None:
+        self.keys.pop(key_id, None)
+        self._stats.pop(key_id, None)
+        self.logger.debug("Removed key %s", key_id)
+
+    def _notify(self, key_ids: set[str]) -> None:
+        if self.on_change is None:
+            return
+        for key_id in key_ids:
+            self.on_change(key_id)
+
+    def run_poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.scan()
+            except Exception:
+                self.logger.exception("Failed to scan %s", self.directory)
+
+    def run_inotify(self, fd: int) -> None:
+        assert self._wakeup is not None
+        wakeup_fd = self._wakeup[0]
+        while not self._stop.is_set():
+            readable, _, _ = select.select([fd, wakeup_fd], [], [])
+            if fd not in readable:
+                continue
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            rescan = False
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0").decode(errors="replace")
+                offset += length
+                if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF) or self._key_id(name) is None:
+                    rescan = True
+                elif mask & (IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                    # Links (ln, ln -s) are only reported as IN_CREATE
+                    try:
+                        self.update(name)
+                    except Exception:
+                        self.logger.exception("Failed to update %s", name)
+            if rescan:
+                try:
+                    self.scan()
+                except Exception:
+                    self.logger.exception("Failed to scan %s", self.directory)
+
+    def _inotify_init(self) -> int | None:
+        assert self._libc is not None
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            self.logger.warning("inotify_init1 failed: %s", os.strerror(ctypes.get_errno()))
+            return None
+        if self._libc.inotify_add_watch(fd, os.fsencode(self.directory), INOTIFY_MASK) < 0:
+            self.logger.warning("inotify_add_watch failed: %s", os.strerror(ctypes.get_errno()))
+            os.close(fd)
+            return None
+        return fd
+
+    def _run(self, fd: int | None) -> None:
+        try:
+            if fd is None:
+                self.run_poll()
+            else:
+                self.run_inotify(fd)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def start(self) -> None:
+        """Load index and start keeping it current in the background"""
+        fd = self._inotify_init() if self._libc is not None else None
+        if fd is None:
+            self._libc = None
+        # Scan after setting up the watch, so no change is missed
+        self.scan()
+        self._stop.clear()
+        self._wakeup = os.pipe()
+        self._thread = threading.Thread(target=self._run, args=(fd,), name="key-directory-index", daemon=True)
+        self._thread.start()
+        self.logger.info("Indexed %d keys in %s (%s)", len(self.keys), self.directory, self.mode)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._wakeup is not None:
+            os.write(self._wakeup[1], b"\0")
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._wakeup is not None:
+            for fd in self._wakeup:
+                os.close(fd)
+            self._wakeup = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -1,6 +1,12 @@
+import asyncio
 import logging
 import re
+import threading
+import time
 from abc import abstractmethod
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
 
@@ -9,10 +15,17 @@ from cryptography.hazmat.primitives.asymmetric.ec import EllipticCurvePublicKey
 from cryptography.hazmat.primitives.asymmetric.ed448 import Ed448PublicKey
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
-from cryptography.hazmat.primitives.serialization import load_pem_public_key
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    PublicFormat,
+    load_der_public_key,
+    load_pem_public_key,
+)
 from opentelemetry import metrics, trace
+from ttlru_map import TTLMap
 
-from .key_cache import KeyCache
+from .key_cache import NEGATIVE, AsyncKeyCache, KeyCache
+from .key_index import KeyDirectoryIndex
 
 PublicKey = Ed25519PublicKey | Ed448PublicKey | EllipticCurvePublicKey | RSAPublicKey
 
@@ -24,14 +37,74 @@ public_key_get_counter = meter.create_counter(
     description="The number of public key lookups",
 )
 
-KEY_ID_VALIDATOR = re.compile(r"^[a-zA-Z0-9_\-.]+$")
+public_key_negative_hit_counter = meter.create_counter(
+    "aggregates.public_key_negative_hit_counter",
+    description="The number of lookups of unknown public keys answered from the negative cache",
+)
+
+public_key_refresh_counter = meter.create_counter(
+    "aggregates.public_key_refresh_counter",
+    description="The number of public keys refreshed ahead of expiry",
+)
+
+public_key_stale_counter = meter.create_counter(
+    "aggregates.public_key_stale_counter",
+    description="The number of stale public keys served while the key source was unavailable",
+)
+
+public_key_lease_wait_counter = meter.create_counter(
+    "aggregates.public_key_lease_wait_counter",
+    description="The number of public key cache misses waiting for a fetch by another process",
+)
 
+public_key_warm_up_counter = meter.create_counter(
+    "aggregates.public_key_warm_up_counter",
+    description="The number of public keys fetched during cache warm-up",
+)
 
-def key_resolver_from_client_database(client_database: str, key_cache: KeyCache | None = None):
+KEY_ID_VALIDATOR = re.compile(r"^[a-zA-Z0-9_\-.]+$")
+KEY_ID_PATTERN = "{key_id}"
+
+# Tags of compact cached key encodings (PEM starts with "-")
+KEY_ENCODING_ED25519 = b"\x01"
+KEY_ENCODING_ED448 = b"\x02"
+KEY_ENCODING_DER = b"\x03"
+
+LEASE_POLL_INTERVAL = 0.05
+
+
+def key_resolver_from_client_database(
+    client_database: str,
+    key_cache: KeyCache | None = None,
+    public_key_cache_size: int = 0,
+    public_key_cache_ttl: int = 300,
+    refresh_ahead: float = 0,
+    max_stale: float = 0,
+    compact_keys: bool = True,
+    single_flight: bool = False,
+):
     if client_database.startswith("http://") or client_database.startswith("https://"):
-        return UrlKeyResolver(client_database_base_url=client_database, key_cache=key_cache)
+        return UrlKeyResolver(
+            client_database_base_url=client_database,
+            key_cache=key_cache,
+            public_key_cache_size=public_key_cache_size,
+            public_key_cache_ttl=public_key_cache_ttl,
+            refresh_ahead=refresh_ahead,
+            max_stale=max_stale,
+            compact_keys=compact_keys,
+            single_flight=single_flight,
+        )
     else:
-        return FileKeyResolver(client_database_directory=client_database, key_cache=key_cache)
+        return FileKeyResolver(
+            client_database_directory=client_database,
+            key_cache=key_cache,
+            public_key_cache_size=public_key_cache_size,
+            public_key_cache_ttl=public_key_cache_ttl,
+            refresh_ahead=refresh_ahead,
+            max_stale=max_stale,
+            compact_keys=compact_keys,
+            single_flight=single_flight,
+        )
 
 
 class KeyResolver:
@@ -40,7 +113,8 @@ class KeyResolver:
         self.key_id_validator = KEY_ID_VALIDATOR
 
     @abstractmethod
-    def resolve_public_key(self, key_id: str) -> PublicKey:
+    def resolve_public_key(self, key_id: str, refresh: bool = False) -> PublicKey:
+        """Resolve public key, with refresh bypassing any caches"""
         pass
 
     def validate_key_id(self, key_id: str) -> None:
@@ -48,34 +122,336 @@ class KeyResolver:
             raise ValueError(f"Invalid key_id format: {key_id}")
 
 
+class KeyUnavailableError(KeyError):
+    """Key could not be resolved due to a (possibly transient) failure of the key source"""
+
+    pass
+
+
+def encode_public_key(public_key: PublicKey) -> bytes:
+    """Encode public key compactly for caching, tagged with the encoding"""
+    if isinstance(public_key, Ed25519PublicKey):
+        return KEY_ENCODING_ED25519 + public_key.public_bytes(encoding=Encoding.Raw, format=PublicFormat.Raw)
+    if isinstance(public_key, Ed448PublicKey):
+        return KEY_ENCODING_ED448 + public_key.public_bytes(encoding=Encoding.Raw, format=PublicFormat.Raw)
+    return KEY_ENCODING_DER + public_key.public_bytes(encoding=Encoding.DER, format=PublicFormat.SubjectPublicKeyInfo)
+
+
+def decode_public_key(data: bytes) -> PublicKey:
+    """Decode public key encoded by encode_public_key() or as PEM"""
+    tag = data[:1]
+    if tag == KEY_ENCODING_ED25519:
+        return Ed25519PublicKey.from_public_bytes(data[1:])
+    if tag == KEY_ENCODING_ED448:
+        return Ed448PublicKey.from_public_bytes(data[1:])
+    if tag == KEY_ENCODING_DER:
+        return load_der_public_key(data[1:])  # type: ignore
+    return load_pem_public_key(data)  # type: ignore
+
+
 class CacheKeyResolver(KeyResolver):
-    def __init__(self, key_cache: KeyCache | None):
+    """Key resolver with an optional key cache
+
+    With compact_keys set (the default), keys are cached using
+    encode_public_key() rather than as PEM. PEM entries are still read, so
+    only disable it while processes sharing a cache are being upgraded.
+
+    With public_key_cache_size set, parsed public keys are also kept in
+    process memory for public_key_cache_ttl seconds, so hot keys skip
+    decoding altogether.
+
+    With refresh_ahead set, cached keys (in the key cache or the public key
+    cache) expiring within refresh_ahead seconds are refreshed in the
+    background while the cached key is still served.
+    With max_stale set, a key last seen less than max_stale seconds ago is
+    served if the key source is unavailable.
+
+    With single_flight set, a cache miss takes a lease on the key in the key
+    cache (for lease_ttl seconds) before fetching it. Processes failing to get
+    the lease poll the cache for up to lease_wait seconds, and then fetch the
+    key themselves.
+    """
+
+    def __init__(
+        self,
+        key_cache: KeyCache | None,
+        public_key_cache_size: int = 0,
+        public_key_cache_ttl: int = 300,
+        refresh_ahead: float = 0,
+        max_stale: float = 0,
+        refresh_workers: int = 4,
+        compact_keys: bool = True,
+        single_flight: bool = False,
+        lease_ttl: float = 5,
+        lease_wait: float = 2,
+    ):
         super().__init__()
         self.key_cache = key_cache
+        self.compact_keys = compact_keys
+        self.single_flight = single_flight
+        self.lease_ttl = lease_ttl
+        self.lease_wait = lease_wait
+        # Parsed public keys are cached with their expiry time
+        self.public_key_cache: TTLMap[str, tuple[PublicKey, float]] | None = (
+            TTLMap(ttl=timedelta(seconds=public_key_cache_ttl), max_size=public_key_cache_size)
+            if public_key_cache_size
+            else None
+        )
+        self.public_key_cache_ttl = public_key_cache_ttl
+        self.refresh_ahead = refresh_ahead
+        self.stale_cache: TTLMap[str, bytes] | None = TTLMap(ttl=timedelta(seconds=max_stale)) if max_stale else None
+        self.refresh_workers = refresh_workers
+        self._refresh_executor: ThreadPoolExecutor | None = None
+        self._refreshing: set[str] = set()
+        self._refreshing_lock = threading.Lock()
 
     @abstractmethod
     def get_public_key_pem(self, key_id: str) -> bytes:
         pass
 
-    def resolve_public_key(self, key_id: str):
+    def resolve_public_key(self, key_id: str, refresh: bool = False):
+        if (
+            not refresh
+            and self.public_key_cache is not None
+            and (entry := self.public_key_cache.get(key_id)) is not None
+        ):
+            public_key, expires = entry
+            if expires - time.monotonic() < self.refresh_ahead:
+                self._schedule_refresh(key_id)
+            return public_key
         with tracer.start_as_current_span("resolve_public_key"):
+            public_key_data, stale = self._resolve_public_key_data(key_id, refresh=refresh)
+            public_key = decode_public_key(public_key_data)
+        if not stale:
+            self._cache_public_key(key_id, public_key)
+        return public_key
+
+    def _cache_public_key(self, key_id: str, public_key: PublicKey) -> None:
+        if self.public_key_cache is not None:
+            self.public_key_cache[key_id] = (public_key, time.monotonic() + self.public_key_cache_ttl)
+
+    def _resolve_public_key_data(self, key_id: str, refresh: bool = False) -> tuple[bytes, bool]:
+        """Get cached key data from cache or key source, returning data and whether it is stale"""
+        if self.key_cache and not refresh:
+            public_key_data, ttl = self.key_cache.get_with_ttl(key_id)
+            if public_key_data == NEGATIVE:
+                public_key_negative_hit_counter.add(1)
+                raise KeyError(key_id)
+            if public_key_data is not None:
+                if ttl is not None and ttl < self.refresh_ahead:
+                    self._schedule_refresh(key_id)
+                if self.stale_cache is not None:
+                    self.stale_cache[key_id] = public_key_data
+                return public_key_data, False
+        try:
+            if self.single_flight and self.key_cache and not refresh:
+                return self._fetch_public_key_data_single_flight(key_id), False
+            return self._fetch_public_key_data(key_id), False
+        except KeyUnavailableError:
+            if self.stale_cache is not None and (public_key_data := self.stale_cache.get(key_id)) is not None:
+                self.logger.warning("Key source unavailable, serving stale public key for %s", key_id)
+                public_key_stale_counter.add(1)
+                return public_key_data, True
+            raise
+
+    def _encode_public_key_pem(self, public_key_pem: bytes) -> bytes:
+        """Convert PEM to cached key data (raising ValueError if not a public key)"""
+        public_key = load_pem_public_key(public_key_pem)
+        return encode_public_key(public_key) if self.compact_keys else public_key_pem  # type: ignore
+
+    def _fetch_public_key_data(self, key_id: str) -> bytes:
+        try:
+            public_key_pem = self.get_public_key_pem(key_id)
+        except KeyUnavailableError:
+            raise
+        except KeyError:
             if self.key_cache:
-                public_key_pem = self.key_cache.get(key_id)
-                if not public_key_pem:
-                    public_key_pem = self.get_public_key_pem(key_id)
-                    self.key_cache.set(key_id, public_key_pem)
-                    public_key_get_counter.add(1)
+                self.key_cache.set_negative(key_id)
+            raise
+        public_key_data = self._encode_public_key_pem(public_key_pem)
+        if self.key_cache:
+            self.key_cache.set(key_id, public_key_data)
+            public_key_get_counter.add(1)
+        if self.stale_cache is not None:
+            self.stale_cache[key_id] = public_key_data
+        return public_key_data
+
+    def _fetch_public_key_data_single_flight(self, key_id: str) -> bytes:
+        """Fetch key while holding its lease, or wait for the lease holder to cache it"""
+        assert self.key_cache
+        token = self.key_cache.acquire_lease(key_id, ttl=self.lease_ttl)
+        if token is None:
+            public_key_lease_wait_counter.add(1)
+            self.logger.debug("Waiting for public key for %s fetched elsewhere", key_id)
+            deadline = time.monotonic() + self.lease_wait
+            while time.monotonic() < deadline:
+                time.sleep(LEASE_POLL_INTERVAL)
+                public_key_data = self.key_cache.get(key_id)
+                if public_key_data == NEGATIVE:
+                    public_key_negative_hit_counter.add(1)
+                    raise KeyError(key_id)
+                if public_key_data is not None:
+                    return public_key_data
+                # Take over if the lease holder gave up
+                if (token := self.key_cache.acquire_lease(key_id, ttl=self.lease_ttl)) is not None:
+                    break
             else:
-                public_key_pem = self.get_public_key_pem(key_id)
-        return load_pem_public_key(public_key_pem)
+                self.logger.debug("Timeout waiting for public key for %s, fetching", key_id)
+        try:
+            return self._fetch_public_key_data(key_id)
+        finally:
+            if token is not None:
+                self.key_cache.release_lease(key_id, token)
+
+    def _schedule_refresh(self, key_id: str) -> None:
+        """Refresh key in the background, unless already being refreshed"""
+        with self._refreshing_lock:
+            if key_id in self._refreshing:
+                return
+            self._refreshing.add(key_id)
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(
+                    max_workers=self.refresh_workers, thread_name_prefix="key-resolver-refresh"
+                )
+        self.logger.debug("Refreshing public key for %s ahead of expiry", key_id)
+        self._refresh_executor.submit(self._refresh, key_id)
+
+    def _refresh(self, key_id: str) -> None:
+        try:
+            public_key_data = self._fetch_public_key_data(key_id)
+            if self.public_key_cache is not None:
+                self._cache_public_key(key_id, decode_public_key(public_key_data))
+            public_key_refresh_counter.add(1)
+        except Exception as exc:
+            self.logger.warning("Failed to refresh public key for %s: %s", key_id, exc)
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(key_id)
+
+    def warm_up(self, key_ids: Iterable[str] | None = None, max_workers: int = 16, batch_size: int = 100) -> int:
+        """Fetch keys not yet cached and fill the caches, returning the number of keys fetched
+
+        Without key_ids, all keys listed by the key source (if it provides
+        list_key_ids()) are fetched. Unknown or unparsable keys are logged and
+        skipped.
+        """
+        if key_ids is None:
+            if not hasattr(self, "list_key_ids"):
+                raise ValueError("key_ids required")
+            key_ids = self.list_key_ids()  # type: ignore
+        key_ids = list(dict.fromkeys(key_ids))
+        if self.key_cache:
+            cached = self.key_cache.get_many(key_ids)
+            key_ids = [key_id for key_id in key_ids if key_id not in cached]
+        self.logger.info("Warming up %d public keys", len(key_ids))
+
+        def fetch(key_id: str) -> bytes | None:
+            try:
+                self.validate_key_id(key_id)
+                return self.get_public_key_pem(key_id)
+            except (KeyError, ValueError) as exc:
+                self.logger.warning("Failed to warm up public key for %s: %s", key_id, exc)
+                return None
+
+        fetched = 0
+        with tracer.start_as_current_span("warm_up"), ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for offset in range(0, len(key_ids), batch_size):
+                batch = key_ids[offset : offset + batch_size]
+                items = {}
+                for key_id, public_key_pem in zip(batch, executor.map(fetch, batch), strict=True):
+                    if public_key_pem is None:
+                        continue
+                    try:
+                        public_key_data = self._encode_public_key_pem(public_key_pem)
+                    except ValueError as exc:
+                        self.logger.warning("Failed to warm up public key for %s: %s", key_id, exc)
+                        continue
+                    items[key_id] = public_key_data
+                    if self.public_key_cache is not None:
+                        self._cache_public_key(key_id, decode_public_key(public_key_data))
+                    if self.stale_cache is not None:
+                        self.stale_cache[key_id] = public_key_data
+                if self.key_cache:
+                    self.key_cache.set_many(items)
+                fetched += len(items)
+                public_key_warm_up_counter.add(len(items))
+                self.logger.debug("Warmed up %d of %d public keys", fetched, len(key_ids))
+        self.logger.info("Warmed up %d public keys", fetched)
+        return fetched
 
 
 class FileKeyResolver(CacheKeyResolver):
-    def __init__(self, client_database_directory: str, key_cache: KeyCache | None = None):
-        super().__init__(key_cache=key_cache)
+    """Key resolver reading PEM files from a directory
+
+    With index set, all keys are loaded into memory and kept current via
+    file system notifications (or polling every index_poll_interval seconds),
+    so lookups never touch the file system.
+    """
+
+    def __init__(
+        self,
+        client_database_directory: str,
+        key_cache: KeyCache | None = None,
+        public_key_cache_size: int = 0,
+        public_key_cache_ttl: int = 300,
+        refresh_ahead: float = 0,
+        max_stale: float = 0,
+        compact_keys: bool = True,
+        single_flight: bool = False,
+        index: bool = False,
+        index_poll_interval: float = 5,
+    ):
+        super().__init__(
+            key_cache=key_cache,
+            public_key_cache_size=public_key_cache_size,
+            public_key_cache_ttl=public_key_cache_ttl,
+            refresh_ahead=refresh_ahead,
+            max_stale=max_stale,
+            compact_keys=compact_keys,
+            single_flight=single_flight,
+        )
         self.client_database_directory = client_database_directory
+        self.index: KeyDirectoryIndex | None = None
+        if index:
+            self.index = KeyDirectoryIndex(
+                directory=client_database_directory,
+                key_id_validator=self.key_id_validator.match,
+                poll_interval=index_poll_interval,
+                on_change=self._key_changed,
+            )
+            self.index.start()
+
+    def _key_changed(self, key_id: str) -> None:
+        if self.public_key_cache is not None:
+            self.public_key_cache.pop(key_id, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """Stop keeping the index current"""
+        if self.index is not None:
+            self.index.stop()
+
+    def list_key_ids(self) -> list[str]:
+        """List all key IDs in the client database directory"""
+        if self.index is not None:
+            return list(self.index.keys)
+        return [
+            path.stem
+            for path in Path(self.client_database_directory).glob("*.pem")
+            if self.key_id_validator.match(path.stem)
+        ]
 
     def get_public_key_pem(self, key_id: str) -> bytes:
+        if self.index is not None:
+            self.validate_key_id(key_id)
+            if (public_key_pem := self.index.get(key_id)) is None:
+                raise KeyError(key_id)
+            return public_key_pem
         with tracer.start_as_current_span("get_public_key_pem_from_file"):
             self.validate_key_id(key_id)
             filename = Path(self.client_database_directory) / f"{key_id}.pem"
@@ -87,41 +463,71 @@ class FileKeyResolver(CacheKeyResolver):
                 raise KeyError(key_id) from exc
 
 
+def validate_client_database_base_url(client_database_base_url: str) -> None:
+    if urlparse(client_database_base_url).scheme not in ("http", "https"):
+        raise ValueError(f"Invalid URL: {client_database_base_url}")
+
+    if KEY_ID_PATTERN in client_database_base_url:
+        test_url = client_database_base_url.replace(KEY_ID_PATTERN, "test")
+        if urlparse(test_url).scheme not in ("http", "https"):
+            raise ValueError(f"Invalid URL pattern: {client_database_base_url}")
+
+
+def public_key_url_from_base_url(client_database_base_url: str, key_id: str) -> str:
+    if KEY_ID_PATTERN in client_database_base_url:
+        public_key_url = client_database_base_url.replace(KEY_ID_PATTERN, key_id)
+    else:
+        public_key_url = urljoin(client_database_base_url, f"{key_id}.pem")
+
+    if urlparse(public_key_url).scheme not in ("http", "https"):
+        raise ValueError(f"Invalid URL constructed: {public_key_url}")
+
+    return public_key_url
+
+
 class UrlKeyResolver(CacheKeyResolver):
-    def __init__(self, client_database_base_url: str, key_cache: KeyCache | None = None):
-        super().__init__(key_cache=key_cache)
+    def __init__(
+        self,
+        client_database_base_url: str,
+        key_cache: KeyCache | None = None,
+        public_key_cache_size: int = 0,
+        public_key_cache_ttl: int = 300,
+        refresh_ahead: float = 0,
+        max_stale: float = 0,
+        compact_keys: bool = True,
+        single_flight: bool = False,
+    ):
+        super().__init__(
+            key_cache=key_cache,
+            public_key_cache_size=public_key_cache_size,
+            public_key_cache_ttl=public_key_cache_ttl,
+            refresh_ahead=refresh_ahead,
+            max_stale=max_stale,
+            compact_keys=compact_keys,
+            single_flight=single_flight,
+        )
 
         self.client_database_base_url = client_database_base_url
         self._httpx_client: httpx.Client | None = None
-        self.key_id_pattern = "{key_id}"
+        self.key_id_pattern = KEY_ID_PATTERN
 
-        if urlparse(self.client_database_base_url).scheme not in ("http", "https"):
-            raise ValueError(f"Invalid URL: {self.client_database_base_url}")
-
-        if self.key_id_pattern in self.client_database_base_url:
-            test_url = self.client_database_base_url.replace(self.key_id_pattern, "test")
-            if urlparse(test_url).scheme not in ("http", "https"):
-                raise ValueError(f"Invalid URL pattern: {self.client_database_base_url}")
+        validate_client_database_base_url(self.client_database_base_url)
 
     def get_public_key_pem(self, key_id: str) -> bytes:
         with tracer.start_as_current_span("get_public_key_pem_from_url"):
             self.validate_key_id(key_id)
-
-            if self.key_id_pattern in self.client_database_base_url:
-                public_key_url = self.client_database_base_url.replace(self.key_id_pattern, key_id)
-            else:
-                public_key_url = urljoin(self.client_database_base_url, f"{key_id}.pem")
-
-            if urlparse(public_key_url).scheme not in ("http", "https"):
-                raise ValueError(f"Invalid URL constructed: {public_key_url}")
-
+            public_key_url = public_key_url_from_base_url(self.client_database_base_url, key_id)
             self.logger.debug("Fetching public key for %s from %s", key_id, public_key_url)
             try:
                 response = self.httpx_client.get(public_key_url)
                 response.raise_for_status()
                 return response.content
-            except httpx.HTTPError as exc:
+            except httpx.HTTPStatusError as exc:
+                if exc.response.is_server_error:
+                    raise KeyUnavailableError(key_id) from exc
                 raise KeyError(key_id) from exc
+            except httpx.HTTPError as exc:
+                raise KeyUnavailableError(key_id) from exc
 
     @property
     def httpx_client(self) -> httpx.Client:
@@ -145,3 +551,153 @@ class UrlKeyResolver(CacheKeyResolver):
                 self._httpx_client.close()
             finally:
                 self._httpx_client = None
+
+
+class AsyncKeyResolver:
+    def __init__(self):
+        self.logger = logging.getLogger(__name__).getChild(self.__class__.__name__)
+        self.key_id_validator = KEY_ID_VALIDATOR
+
+    @abstractmethod
+    async def resolve_public_key(self, key_id: str) -> PublicKey:
+        pass
+
+    def validate_key_id(self, key_id: str) -> None:
+        if not self.key_id_validator.match(key_id):
+            raise ValueError(f"Invalid key_id format: {key_id}")
+
+
+class AsyncCacheKeyResolver(AsyncKeyResolver):
+    """Async key resolver coalescing concurrent fetches of the same key
+
+    The key cache may be a KeyCache or, to avoid blocking the event loop on
+    remote caches, an AsyncKeyCache.
+    """
+
+    def __init__(self, key_cache: KeyCache | AsyncKeyCache | None, compact_keys: bool = True):
+        super().__init__()
+        self.key_cache = key_cache
+        self.compact_keys = compact_keys
+        self._inflight: dict[str, asyncio.Future[bytes]] = {}
+
+    @abstractmethod
+    async def get_public_key_pem(self, key_id: str) -> bytes:
+        pass
+
+    async def resolve_public_key(self, key_id: str):
+        with tracer.start_as_current_span("resolve_public_key"):
+            if isinstance(self.key_cache, AsyncKeyCache):
+                public_key_data = await self.key_cache.get(key_id)
+            else:
+                public_key_data = self.key_cache.get(key_id) if self.key_cache else None
+            if public_key_data == NEGATIVE:
+                public_key_negative_hit_counter.add(1)
+                raise KeyError(key_id)
+            if public_key_data is None:
+                public_key_data = await self.fetch_public_key_pem(key_id)
+            return decode_public_key(public_key_data)
+
+    async def fetch_public_key_pem(self, key_id: str) -> bytes:
+        """Fetch public key, sharing a single fetch between all concurrent callers"""
+        if (future := self._inflight.get(key_id)) is None:
+            future = asyncio.ensure_future(self._fetch_public_key_pem(key_id))
+            self._inflight[key_id] = future
+            future.add_done_callback(lambda future: self._fetch_done(key_id, future))
+        else:
+            self.logger.debug("Joining fetch of public key for %s", key_id)
+        # Shield the shared fetch from cancellation of a single caller
+        return await asyncio.shield(future)
+
+    def _fetch_done(self, key_id: str, future: asyncio.Future[bytes]) -> None:
+        self._inflight.pop(key_id, None)
+        # Retrieve the exception, as every caller may have been cancelled
+        if not future.cancelled():
+            future.exception()
+
+    async def _fetch_public_key_pem(self, key_id: str) -> bytes:
+        try:
+            public_key_pem = await self.get_public_key_pem(key_id)
+        except KeyUnavailableError:
+            raise
+        except KeyError:
+            if isinstance(self.key_cache, AsyncKeyCache):
+                await self.key_cache.set_negative(key_id)
+            elif self.key_cache:
+                self.key_cache.set_negative(key_id)
+            raise
+        if self.compact_keys:
+            public_key_data = encode_public_key(load_pem_public_key(public_key_pem))  # type: ignore
+        else:
+            public_key_data = public_key_pem
+        if isinstance(self.key_cache, AsyncKeyCache):
+            await self.key_cache.set(key_id, public_key_data)
+        elif self.key_cache:
+            self.key_cache.set(key_id, public_key_data)
+        if self.key_cache:
+            public_key_get_counter.add(1)
+        return public_key_pem
+
+
+class AsyncUrlKeyResolver(AsyncCacheKeyResolver):
+    """Async variant of UrlKeyResolver, using a pooled httpx.AsyncClient
+
+    HTTP/2 requires the h2 package (httpx[http2]).
+    """
+
+    def __init__(
+        self,
+        client_database_base_url: str,
+        key_cache: KeyCache | AsyncKeyCache | None = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        http2: bool = False,
+        compact_keys: bool = True,
+    ):
+        super().__init__(key_cache=key_cache, compact_keys=compact_keys)
+
+        self.client_database_base_url = client_database_base_url
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.http2 = http2
+        self._httpx_client: httpx.AsyncClient | None = None
+
+        validate_client_database_base_url(self.client_database_base_url)
+
+    async def get_public_key_pem(self, key_id: str) -> bytes:
+        with tracer.start_as_current_span("get_public_key_pem_from_url"):
+            self.validate_key_id(key_id)
+            public_key_url = public_key_url_from_base_url(self.client_database_base_url, key_id)
+            self.logger.debug("Fetching public key for %s from %s", key_id, public_key_url)
+            try:
+                response = await self.httpx_client.get(public_key_url)
+                response.raise_for_status()
+                return response.content
+            except httpx.HTTPStatusError as exc:
+                if exc.response.is_server_error:
+                    raise KeyUnavailableError(key_id) from exc
+                raise KeyError(key_id) from exc
+            except httpx.HTTPError as exc:
+                raise KeyUnavailableError(key_id) from exc
+
+    @property
+    def httpx_client(self) -> httpx.AsyncClient:
+        if self._httpx_client is None:
+            self._httpx_client = httpx.AsyncClient(
+                headers={"Accept": "application/x-pem-file"},
+                limits=self.limits,
+                http2=self.http2,
+            )
+        return self._httpx_client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Explicitly close the client and free resources."""
+        if self._httpx_client is not None:
+            try:
+                await self._httpx_client.aclose()
+            finally:
+                self._httpx_client = None
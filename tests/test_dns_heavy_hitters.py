@@ -0,0 +1,156 @@
+import io
+import random
+from collections import Counter
+
+import pytest
+
+from dnstapir.dns.heavy_hitters import CoreDomainAggregator, CountMinSketch, SpaceSaving
+from dnstapir.dns.mozpsl import PublicSuffixList
+
+PSL_SAMPLE = """\
+// ===BEGIN ICANN DOMAINS===
+com
+se
+co.uk
+// ===END ICANN DOMAINS===
+// ===BEGIN PRIVATE DOMAINS===
+*.compute.amazonaws.com
+github.io
+// ===END PRIVATE DOMAINS===
+"""
+
+
+def _psl() -> PublicSuffixList:
+    psl = PublicSuffixList()
+    psl.load_psl(io.StringIO(PSL_SAMPLE))
+    return psl
+
+
+def _zipf_stream(count: int, distinct: int, seed: int = 0) -> list[str]:
+    """Skewed stream of query names over distinct core domains"""
+    rng = random.Random(seed)
+    suffixes = ["com", "se", "co.uk", "github.io", "invalid"]
+    domains = [f"d{rank}.{suffixes[rank % len(suffixes)]}." for rank in range(distinct)]
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    return [f"www{rng.randint(0, 3)}.{domain}" for domain in rng.choices(domains, weights=weights, k=count)]
+
+
+def test_count_min_sketch_bounds():
+    epsilon, delta = 0.01, 0.01
+    sketch = CountMinSketch.from_error(epsilon=epsilon, delta=delta, seed=42)
+    assert sketch.epsilon <= epsilon
+    assert sketch.delta <= delta
+
+    rng = random.Random(1)
+    keys = [f"key{rng.randint(0, 5000)}" for _ in range(20000)]
+    actual = Counter(keys)
+    for key in keys:
+        sketch.add(key)
+    assert sketch.total == len(keys)
+
+    errors = [sketch.estimate(key) - count for key, count in actual.items()]
+    assert min(errors) >= 0
+    assert sum(error > epsilon * sketch.total for error in errors) <= delta * len(actual)
+
+    with pytest.raises(ValueError):
+        sketch.merge(CountMinSketch.from_error(epsilon=epsilon, delta=delta, seed=0))
+    with pytest.raises(ValueError):
+        CountMinSketch.from_error(epsilon=0, delta=delta)
+
+
+def test_space_saving_bounds():
+    capacity = 50
+    summary = SpaceSaving(capacity=capacity)
+    rng = random.Random(2)
+    keys = [f"key{int(rng.paretovariate(1.2))}" for _ in range(20000)]
+    actual = Counter(keys)
+    for key in keys:
+        summary.add(key)
+
+    assert len(summary.counters) == capacity
+    for key, count, error in summary.items():
+        assert count - error <= actual[key] <= count
+        assert error <= summary.total / capacity
+    # Every key occurring more than total / capacity times is monitored
+    for key, count in actual.items():
+        if count > summary.total / capacity:
+            assert summary.get(key) is not None
+        elif summary.get(key) is None:
+            assert count <= summary.min_count()
+
+
+def test_aggregator():
+    psl = _psl()
+    names = _zipf_stream(20000, 2000)
+    aggregator = CoreDomainAggregator(psl, epsilon=0.001, delta=0.01, capacity=100)
+    for name in names:
+        aggregator.add(name)
+
+    actual = Counter(core or pcore for core, pcore in zip(*psl.coredomain_many(names), strict=True) if core is not None)
+    assert aggregator.unmatched == len(names) - sum(actual.values())
+    assert aggregator.total == sum(actual.values())
+
+    top = aggregator.top(10)
+    assert [hitter.domain for hitter in top] == [domain for domain, _ in actual.most_common(10)]
+    for hitter in aggregator.top():
+        assert hitter.count - hitter.error <= actual[hitter.domain] <= hitter.count
+    for domain, count in actual.items():
+        assert count <= aggregator.estimate(domain) <= count + aggregator.sketch.epsilon * aggregator.total
+
+    # Batched counting gives the same sketch
+    batched = CoreDomainAggregator(psl, epsilon=0.001, delta=0.01, capacity=100)
+    batched.add_many(names)
+    assert batched.sketch.counters == aggregator.sketch.counters
+    assert batched.unmatched == aggregator.unmatched
+
+    assert aggregator.add("www.example.com.") == "example.com."
+    assert aggregator.add("www.example.github.io.") == "example.github.io."
+    assert aggregator.add("www.x.eu-west-1.compute.amazonaws.com.") == "amazonaws.com."
+    private = CoreDomainAggregator(psl, private=True)
+    assert private.add("www.example.github.io.") == "example.github.io."
+    assert private.add("www.example.com.") == "example.com."
+    assert private.add("www.x.eu-west-1.compute.amazonaws.com.") == "x.eu-west-1.compute.amazonaws.com."
+    assert private.add("local.") is None
+    with pytest.raises(ValueError):
+        aggregator.merge(private)
+    with pytest.raises(ValueError):
+        CoreDomainAggregator().add("www.example.com.")
+
+
+def test_aggregator_merge():
+    psl = _psl()
+    names = _zipf_stream(20000, 2000, seed=3)
+    actual = Counter(core or pcore for core, pcore in zip(*psl.coredomain_many(names), strict=True) if core is not None)
+
+    single = CoreDomainAggregator(psl, capacity=100)
+    single.add_many(names)
+
+    # Four workers, merged through snapshots without a PSL
+    merged = CoreDomainAggregator(capacity=100)
+    for worker in range(4):
+        aggregator = CoreDomainAggregator(psl, capacity=100)
+        aggregator.add_many(names[worker::4])
+        merged.merge(CoreDomainAggregator.from_bytes(aggregator.to_bytes()))
+
+    assert merged.sketch.counters == single.sketch.counters
+    assert merged.total == single.total
+    assert merged.unmatched == single.unmatched
+    assert [hitter.domain for hitter in merged.top(5)] == [domain for domain, _ in actual.most_common(5)]
+    for hitter in merged.top():
+        assert hitter.count - hitter.error <= actual[hitter.domain] <= hitter.count
+        assert hitter.error <= merged.total / 100
+
+    # Snapshot round trip
+    data = merged.to_bytes()
+    loaded = CoreDomainAggregator.from_bytes(data, psl=psl)
+    assert loaded.top() == merged.top()
+    assert loaded.to_bytes() == data
+    loaded.add("www.d0.com.")
+    assert loaded.estimate("d0.com.") == merged.estimate("d0.com.") + 1
+
+    with pytest.raises(ValueError):
+        CoreDomainAggregator.from_bytes(data[:10])
+    with pytest.raises(ValueError):
+        CoreDomainAggregator.from_bytes(data[:-1] + bytes([data[-1] ^ 1]))
+    with pytest.raises(ValueError):
+        CoreDomainAggregator.from_bytes(b"x" * len(data))
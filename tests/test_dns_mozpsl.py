@@ -1,14 +1,36 @@
+import hashlib
+import io
+import json
+import os
+import time
+from pathlib import Path
+
 import pytest
+from pytest_httpx import HTTPXMock
 
-from dnstapir.dns.mozpsl import PublicSuffixList
+from dnstapir.dns.mozpsl import SNAPSHOT_HEADER, CompiledTrie, PublicSuffixList, PublicSuffixListRefresher, main
 
 MOZ_PSL = "https://publicsuffix.org/list/public_suffix_list.dat"
+VENDORED_PSL = Path(__file__).parent / "data" / "public_suffix_list.dat"
 
 
 def test_mozpsl():
     psl = PublicSuffixList()
     psl.load_psl_url(url=MOZ_PSL)
+    _check_full_psl(psl)
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_mozpsl_vendored(compiled: bool):
+    """Same checks as test_mozpsl(), offline against the vendored list"""
+    psl = PublicSuffixList(compiled=compiled)
+    psl.load_psl(VENDORED_PSL)
+    _check_full_psl(psl)
 
+    assert psl.coredomain_wire(b"\x03www\x09Microsoft\x03com\x02br\x00") == (4, None)
+
+
+def _check_full_psl(psl: PublicSuffixList) -> None:
     assert psl.coredomain("www.ck.") == ("ck.", "")
     assert psl.coredomain("www.something.gov.ck.") == ("something.gov.ck.", "")
     assert psl.coredomain("www.something.or.other.microsoft.com.") == ("microsoft.com.", "")
@@ -35,3 +57,303 @@ def test_mozpsl():
         psl.coredomain(None)
     with pytest.raises(KeyError):
         psl.coredomain("invalid..domain.")
+
+
+PSL_SAMPLE = """\
+// ===BEGIN ICANN DOMAINS===
+com
+br
+com.br
+ck
+*.ck
+!www.ck
+de
+io
+// ===END ICANN DOMAINS===
+// ===BEGIN PRIVATE DOMAINS===
+*.compute.amazonaws.com
+github.io
+// ===END PRIVATE DOMAINS===
+"""
+
+
+def _sample_psl(compiled: bool = False) -> PublicSuffixList:
+    psl = PublicSuffixList(compiled=compiled)
+    psl.load_psl(io.StringIO(PSL_SAMPLE))
+    return psl
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_mozpsl_sample(compiled: bool):
+    psl = _sample_psl(compiled=compiled)
+    assert isinstance(psl.trie, CompiledTrie) == compiled
+
+    assert psl.coredomain("www.ck.") == ("ck.", "")
+    assert psl.coredomain("www.something.gov.ck.") == ("something.gov.ck.", "")
+    assert psl.coredomain("www.microsoft.com.br.") == ("microsoft.com.br.", "")
+    assert psl.coredomain("www.example.github.io.") == ("github.io.", "example.github.io.")
+    assert psl.rdomain("io.github.example.www") == ("io.github", "io.github.example")
+
+    with pytest.raises(KeyError):
+        psl.coredomain("local.")
+
+
+def _to_wire(domain: str) -> bytes:
+    return b"".join(bytes([len(label)]) + label.encode() for label in domain.rstrip(".").split(".")) + b"\x00"
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_mozpsl_wire(compiled: bool):
+    psl = _sample_psl(compiled=compiled)
+    domains = [
+        "www.example.com.",
+        "WWW.Example.COM.BR.",
+        "com.",
+        "a.b.c.ck.",
+        "www.ck.",
+        "foo.bar.github.io.",
+        "a.b.eu-west-1.compute.amazonaws.com.",
+    ]
+    for domain in domains:
+        core, pcore = psl.coredomain(domain.lower())
+        name = _to_wire(domain)
+        core_offset, pcore_offset = psl.coredomain_wire(name)
+        folded = name.lower()
+        assert (folded[core_offset:] if core_offset is not None else b"") == (_to_wire(core) if core else b"")
+        assert (folded[pcore_offset:] if pcore_offset is not None else b"") == (_to_wire(pcore) if pcore else b"")
+
+        # Also from a larger buffer and as labels
+        assert psl.coredomain_wire(memoryview(b"\xff" * 12 + name + b"\x00\x01")[12:]) == (core_offset, pcore_offset)
+        labels = [label.encode() for label in domain.split(".")]
+        core_index, pcore_index = psl.coredomain_labels(labels)
+        assert b".".join(labels[core_index:]).decode().lower() == core
+        assert (pcore_index is None) == (pcore == "")
+
+    with pytest.raises(KeyError):
+        psl.coredomain_wire(_to_wire("example.invalid"))
+    with pytest.raises(KeyError):
+        psl.coredomain_labels([b"example", b"invalid"])
+    # 255 octets is the longest valid name
+    assert psl.coredomain_wire(b"\x01a" * 121 + b"\x07example\x03com\x00") == (242, None)
+    long_names = [b"\x02aa" + b"\x01a" * 120 + b"\x07example\x03com\x00", b"\x01a" * 128 + b"\x00"]
+    for name in [b"", b"\x00", b"\x07example\x03com", b"\xc0\x0c", *long_names]:
+        with pytest.raises(ValueError):
+            psl.coredomain_wire(name)
+    with pytest.raises(ValueError):
+        psl.coredomain_labels([b""])
+
+    # Wire format lookups use the new list from the first lookup after a reload
+    psl.load_psl(io.StringIO("// ===BEGIN ICANN DOMAINS===\ninvalid\n"))
+    assert isinstance(psl._wire_trie, CompiledTrie)
+    assert psl.coredomain_wire(_to_wire("example.invalid")) == (0, None)
+    with pytest.raises(KeyError):
+        psl.coredomain_wire(_to_wire("www.example.com"))
+
+
+def test_mozpsl_many():
+    psl = _sample_psl()
+
+    domains = [
+        "www.microsoft.com.",
+        "www.example.github.io.",
+        "local.",
+        "www.microsoft.com.",
+        "",
+        None,
+        "www.something.gov.ck",
+    ]
+    core, pcore = psl.coredomain_many(iter(domains))
+    assert len(core) == len(pcore) == len(domains)
+    for domain, c, p in zip(domains, core, pcore, strict=True):
+        try:
+            assert (c, p) == psl.coredomain(domain)
+        except (KeyError, ValueError):
+            assert (c, p) == (None, None)
+
+    rdomains = ["com.microsoft.www", "io.github.example.www", "local", "de"]
+    core, pcore = psl.rdomain_many(rdomains)
+    assert core == ["com.microsoft", "io.github", None, "de"]
+    assert pcore == ["", "io.github.example", None, ""]
+
+
+def test_mozpsl_many_array():
+    np = pytest.importorskip("numpy")
+    psl = _sample_psl()
+
+    domains = np.array(["www.microsoft.com.", "www.example.github.io.", "local."])
+    assert psl.coredomain_many(domains) == (
+        ["microsoft.com.", "github.io.", None],
+        ["", "example.github.io.", None],
+    )
+
+
+def test_mozpsl_compiled():
+    psl = _sample_psl()
+    compiled = CompiledTrie.from_trie(psl.trie)
+
+    for name in ["com", "com.microsoft.www", "br.com.x", "ck.www", "ck.gov.x", "io.github.x.y", "local", "com..x"]:
+        key = name.split(".")
+        try:
+            expected = psl.trie.search(key)
+        except KeyError:
+            with pytest.raises(KeyError):
+                compiled.search(key)
+        else:
+            assert compiled.search(key) == expected
+
+
+def test_mozpsl_snapshot(tmp_path):
+    psl = _sample_psl()
+    assert psl.checksum == hashlib.sha256(PSL_SAMPLE.encode()).digest()
+
+    snapshot = tmp_path / "psl.snapshot"
+    psl.save_snapshot(snapshot)
+
+    # uint32 sections follow the header and labels padded to 4 bytes
+    assert SNAPSHOT_HEADER.size % 4 == 0
+
+    loaded = PublicSuffixList.from_snapshot(snapshot, checksum=psl.checksum)
+    assert isinstance(loaded.trie, CompiledTrie)
+    assert loaded.checksum == psl.checksum
+    for name in ["www.ck.", "www.something.gov.ck.", "www.microsoft.com.br.", "www.example.github.io."]:
+        assert loaded.coredomain(name) == psl.coredomain(name)
+    with pytest.raises(KeyError):
+        loaded.coredomain("local.")
+
+    with pytest.raises(ValueError):
+        PublicSuffixList.from_snapshot(snapshot, checksum=bytes(32))
+
+    data = snapshot.read_bytes()
+    (tmp_path / "corrupt").write_bytes(data[:-1] + bytes([data[-1] ^ 1]))
+    with pytest.raises(ValueError):
+        PublicSuffixList.from_snapshot(tmp_path / "corrupt")
+
+    (tmp_path / "truncated").write_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        PublicSuffixList.from_snapshot(tmp_path / "truncated")
+
+    (tmp_path / "other").write_bytes(b"x" * len(data))
+    with pytest.raises(ValueError):
+        PublicSuffixList.from_snapshot(tmp_path / "other")
+
+
+@pytest.mark.parametrize("policy", ["lru", "fifo"])
+def test_mozpsl_cache(policy: str):
+    psl = PublicSuffixList(cache_size=2, cache_policy=policy)
+    psl.load_psl(io.StringIO(PSL_SAMPLE))
+
+    assert psl.coredomain("www.microsoft.com.") == ("microsoft.com.", "")
+    assert psl.coredomain("www.microsoft.com.") == ("microsoft.com.", "")
+    with pytest.raises(KeyError):
+        psl.coredomain("local.")
+    with pytest.raises(KeyError):
+        psl.coredomain("local.")
+    assert psl.cache_info() == (2, 2, 2, 2)
+
+    # Evicts the least recently used or the oldest entry
+    psl.coredomain("www.microsoft.com.")
+    psl.coredomain("www.example.github.io.")
+    psl.coredomain("www.microsoft.com.")
+    expected_misses = 3 if policy == "lru" else 4
+    assert psl.cache_info().misses == expected_misses
+
+    # Reloading clears the cache
+    psl.load_psl(io.StringIO(PSL_SAMPLE + "local\n"))
+    assert psl.cache_info().currsize == 0
+    assert psl.coredomain("www.local.") == ("", "www.local.")
+
+    with pytest.raises(ValueError):
+        psl.coredomain("")
+    with pytest.raises(ValueError):
+        PublicSuffixList(cache_size=10, cache_policy="random")
+
+    assert PublicSuffixList().cache_info() is None
+
+
+def test_mozpsl_conditional_get(httpx_mock: HTTPXMock):
+    url = "https://psl/public_suffix_list.dat"
+    etag = '"v1"'
+    httpx_mock.add_response(url=url, text=PSL_SAMPLE, headers={"ETag": etag}, match_headers={"Accept-Encoding": "gzip"})
+    httpx_mock.add_response(url=url, status_code=304, match_headers={"If-None-Match": etag})
+
+    psl = PublicSuffixList()
+    assert psl.load_psl_url(url) is True
+    assert psl.checksum == hashlib.sha256(PSL_SAMPLE.encode()).digest()
+    assert psl.load_psl_url(url) is False
+    assert psl.coredomain("www.microsoft.com.") == ("microsoft.com.", "")
+
+
+def test_mozpsl_refresher(tmp_path):
+    filename = tmp_path / "public_suffix_list.dat"
+    filename.write_text(PSL_SAMPLE)
+
+    psl = PublicSuffixList(cache_size=100)
+    refresher = PublicSuffixListRefresher(psl, filename, interval=0.01)
+    with refresher:
+        with pytest.raises(KeyError):
+            psl.coredomain("www.local.")
+        trie = psl.trie
+
+        filename.write_text(PSL_SAMPLE + "local\n")
+        os.utime(filename, ns=(0, 0))
+        for _ in range(500):
+            if psl.trie is not trie:
+                break
+            time.sleep(0.01)
+        assert psl.coredomain("www.local.") == ("", "www.local.")
+
+        # Broken file keeps the current list
+        trie = psl.trie
+        filename.unlink()
+        time.sleep(0.05)
+        assert psl.trie is trie
+
+
+def test_mozpsl_load_sources(tmp_path):
+    expected = _sample_psl()
+    filename = tmp_path / "public_suffix_list.dat"
+    filename.write_text("// ===BEGIN ICANN DOMAINS===\nрф\n" + PSL_SAMPLE)
+
+    for source in [filename, str(filename), io.BytesIO(filename.read_bytes())]:
+        psl = PublicSuffixList()
+        psl.load_psl(source)
+        assert psl.checksum == hashlib.sha256(filename.read_bytes()).digest()
+        assert psl.coredomain("www.example.github.io.") == expected.coredomain("www.example.github.io.")
+        assert psl.coredomain("www.xn--80ak6aa92e.xn--p1ai.") == ("xn--80ak6aa92e.xn--p1ai.", "")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_mozpsl_main(tmp_path, workers: int):
+    psl_file = tmp_path / "public_suffix_list.dat"
+    psl_file.write_text(PSL_SAMPLE)
+    names = ["www.microsoft.com.", "www.example.github.io.", "local.", "www.something.gov.ck.", "de."] * 7
+    names_file = tmp_path / "names.txt"
+    names_file.write_text("\n".join(names) + "\n")
+    expected = _sample_psl().coredomain_many(names)
+
+    args = ["--psl", str(psl_file), "--workers", str(workers), "--chunk-size", "3", str(names_file)]
+
+    main([*args, "--output", str(tmp_path / "out.tsv")])
+    rows = [line.split("\t") for line in (tmp_path / "out.tsv").read_text().splitlines()]
+    assert rows == [[n, c or "", p or ""] for n, c, p in zip(names, *expected, strict=True)]
+
+    main([*args, "--format", "ndjson", "--output", str(tmp_path / "out.ndjson")])
+    rows = [json.loads(line) for line in (tmp_path / "out.ndjson").read_text().splitlines()]
+    assert rows == [{"name": n, "core": c, "pcore": p} for n, c, p in zip(names, *expected, strict=True)]
+
+
+def test_mozpsl_main_parquet(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    psl = _sample_psl(compiled=True)
+    psl.save_snapshot(tmp_path / "psl.snapshot")
+    names = ["www.microsoft.com.", "local.", "www.example.github.io."]
+    (tmp_path / "names.txt").write_text("\n".join(names))
+
+    output = tmp_path / "out.parquet"
+    args = ["--snapshot", str(tmp_path / "psl.snapshot"), "--workers", "1", str(tmp_path / "names.txt")]
+    main([*args, "--format", "parquet", "--output", str(output)])
+    assert parquet.read_table(output).to_pydict() == {
+        "name": names,
+        "core": ["microsoft.com.", None, "github.io."],
+        "pcore": ["", None, "example.github.io."],
+    }
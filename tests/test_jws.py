@@ -1,14 +1,19 @@
 import json
 import logging
+import threading
+import time
 
+import pytest
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import ed25519
+from jwcrypto.common import JWKeyNotFound
 from jwcrypto.jwk import JWK
 from jwcrypto.jws import JWS
 from pytest_httpx import HTTPXMock
 
-from dnstapir.jws import ResolverJWKSet
-from dnstapir.key_resolver import UrlKeyResolver
+from dnstapir.jws import ResolverJWKSet, main
+from dnstapir.key_cache import MemoryKeyCache
+from dnstapir.key_resolver import FileKeyResolver, KeyResolver, KeyUnavailableError, UrlKeyResolver
 
 
 def test_jws_verifier(httpx_mock: HTTPXMock):
@@ -45,3 +50,308 @@ def test_jws_verifier(httpx_mock: HTTPXMock):
     jws.deserialize(message)
     verified_jwk = keyset.verify_jws(jws)
     assert verified_jwk.thumbprint() == public_jwk.thumbprint()
+
+
+def test_jws_verifier_key_rotation(httpx_mock: HTTPXMock):
+    """Test JWS verifier refreshing a rotated key once"""
+
+    key_id = "xyzzy"
+    alg = "EdDSA"
+    url = f"https://keys/api/v1/node/{key_id}/public_key"
+    old_private_key = ed25519.Ed25519PrivateKey.generate()
+    new_private_key = ed25519.Ed25519PrivateKey.generate()
+
+    for private_key in [old_private_key, new_private_key, new_private_key]:
+        httpx_mock.add_response(
+            url=url,
+            content=private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+            ),
+        )
+
+    def sign(private_key) -> JWS:
+        client_jws = JWS(payload=json.dumps({"hello": "world"}))
+        client_jws.add_signature(key=JWK.from_pyca(private_key), alg=alg, protected={"kid": key_id, "alg": alg})
+        jws = JWS()
+        jws.deserialize(client_jws.serialize())
+        return jws
+
+    key_resolver = UrlKeyResolver(
+        client_database_base_url="https://keys/api/v1/node/{key_id}/public_key",
+        key_cache=MemoryKeyCache(size=10, ttl=60),
+        public_key_cache_size=10,
+    )
+    keyset = ResolverJWKSet(key_resolver=key_resolver, cache_size=10, cache_ttl=60, refresh_interval=0.1)
+
+    # Old key gets cached
+    keyset.verify_jws(sign(old_private_key))
+    assert len(httpx_mock.get_requests(url=url)) == 1
+
+    # Rotated key is fetched once, bypassing the resolver caches
+    time.sleep(0.1)
+    verified_jwk = keyset.verify_jws(sign(new_private_key))
+    assert verified_jwk.thumbprint() == JWK.from_pyca(new_private_key.public_key()).thumbprint()
+    assert len(httpx_mock.get_requests(url=url)) == 2
+    keyset.verify_jws(sign(new_private_key))
+    assert len(httpx_mock.get_requests(url=url)) == 2
+
+    # Bad signature does not refresh a recently resolved key
+    with pytest.raises(JWKeyNotFound):
+        keyset.verify_jws(sign(old_private_key))
+    assert len(httpx_mock.get_requests(url=url)) == 2
+
+    # Bad signature is retried at most once
+    time.sleep(0.1)
+    with pytest.raises(JWKeyNotFound):
+        keyset.verify_jws(sign(old_private_key))
+    assert len(httpx_mock.get_requests(url=url)) == 3
+
+
+def test_jws_verifier_forged_messages(httpx_mock: HTTPXMock):
+    """Test forged messages not forcing a key fetch each"""
+
+    key_id = "xyzzy"
+    alg = "EdDSA"
+    url = f"https://keys/api/v1/node/{key_id}/public_key"
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    forged_private_key = ed25519.Ed25519PrivateKey.generate()
+    httpx_mock.add_response(
+        url=url,
+        content=private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ),
+        is_reusable=True,
+    )
+
+    def sign(private_key) -> str:
+        client_jws = JWS(payload=json.dumps({"hello": "world"}))
+        client_jws.add_signature(key=JWK.from_pyca(private_key), alg=alg, protected={"kid": key_id, "alg": alg})
+        return client_jws.serialize()
+
+    key_resolver = UrlKeyResolver(
+        client_database_base_url="https://keys/api/v1/node/{key_id}/public_key",
+        key_cache=MemoryKeyCache(size=10, ttl=60),
+    )
+    keyset = ResolverJWKSet(key_resolver=key_resolver, refresh_interval=0.2)
+
+    keyset.verify_jws(_deserialize(sign(private_key)))
+    time.sleep(0.2)
+    for _ in range(50):
+        with pytest.raises(JWKeyNotFound):
+            keyset.verify_jws(_deserialize(sign(forged_private_key)))
+    results = keyset.verify_many([sign(forged_private_key)] * 50 + [sign(private_key)])
+    assert [result.verified for result in results] == [False] * 50 + [True]
+
+    # Initial fetch and a single refresh
+    assert len(httpx_mock.get_requests(url=url)) == 2
+
+
+def _deserialize(message: str) -> JWS:
+    jws = JWS()
+    jws.deserialize(message)
+    return jws
+
+
+def test_jws_verify_many(tmp_path):
+    """Test batch JWS verification"""
+
+    alg = "EdDSA"
+    private_keys = {key_id: ed25519.Ed25519PrivateKey.generate() for key_id in ["alice", "bob"]}
+    for key_id, private_key in private_keys.items():
+        with open(tmp_path / f"{key_id}.pem", "wb") as fp:
+            fp.write(
+                private_key.public_key().public_bytes(
+                    encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+                )
+            )
+
+    def sign(key_id: str, private_key) -> str:
+        client_jws = JWS(payload=json.dumps({"hello": key_id}))
+        client_jws.add_signature(key=JWK.from_pyca(private_key), alg=alg, protected={"kid": key_id, "alg": alg})
+        return client_jws.serialize()
+
+    messages = [
+        sign("alice", private_keys["alice"]),
+        sign("bob", private_keys["bob"]),
+        sign("alice", private_keys["alice"]),
+        sign("alice", private_keys["bob"]),
+        sign("mallory", private_keys["bob"]),
+        "garbage",
+    ]
+
+    keyset = ResolverJWKSet(key_resolver=FileKeyResolver(client_database_directory=str(tmp_path)), max_workers=4)
+    results = keyset.verify_many(messages)
+
+    assert len(results) == len(messages)
+    assert [result.verified for result in results] == [True, True, True, False, False, False]
+    assert results[0].key.thumbprint() == JWK.from_pyca(private_keys["alice"].public_key()).thumbprint()
+    assert results[1].key.thumbprint() == JWK.from_pyca(private_keys["bob"].public_key()).thumbprint()
+    assert results[0].jws.payload == b'{"hello": "alice"}'
+    assert isinstance(results[3].error, JWKeyNotFound)
+    assert isinstance(results[4].error, KeyError)
+    assert results[5].jws is None and results[5].error is not None
+
+
+def test_jws_main_batch(httpx_mock: HTTPXMock, tmp_path, capsys):
+    """Test batch mode of the JWS verifier CLI"""
+
+    alg = "EdDSA"
+    private_keys = {key_id: ed25519.Ed25519PrivateKey.generate() for key_id in ["alice", "bob"]}
+    for key_id, private_key in private_keys.items():
+        httpx_mock.add_response(
+            url=f"https://nodeman/api/v1/node/{key_id}/public_key",
+            content=private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+            ),
+            is_reusable=True,
+        )
+    httpx_mock.add_response(url="https://nodeman/api/v1/node/mallory/public_key", status_code=404, is_reusable=True)
+
+    def sign(key_id: str, private_key) -> str:
+        client_jws = JWS(payload=json.dumps({"hello": key_id}))
+        client_jws.add_signature(key=JWK.from_pyca(private_key), alg=alg, protected={"kid": key_id, "alg": alg})
+        return client_jws.serialize(compact=True)
+
+    messages = [
+        sign("alice", private_keys["alice"]),
+        sign("bob", private_keys["bob"]),
+        sign("mallory", private_keys["bob"]),
+        sign("alice", private_keys["alice"]),
+        "",
+        "garbage",
+    ] * 3
+    (tmp_path / "messages.txt").write_text("\n".join(messages) + "\n")
+
+    args = ["--nodeman", "https://nodeman", "--batch-size", "4", "--payload"]
+    with pytest.raises(SystemExit) as exc_info:
+        main([*args, "--batch", str(tmp_path / "messages.txt")])
+    assert exc_info.value.code == 1
+
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(results) == 15
+    assert [result["line"] for result in results[:5]] == [1, 2, 3, 4, 6]
+    assert [result["verified"] for result in results[:5]] == [True, True, False, True, False]
+    assert [result["kid"] for result in results[:5]] == ["alice", "bob", "mallory", "alice", None]
+    assert results[0]["payload"] == '{"hello": "alice"}'
+    assert "KeyError" in results[2]["error"]
+    assert "payload" not in results[2]
+
+    # Keys are fetched once across batches, unknown keys are negative cached
+    for key_id in ["alice", "bob", "mallory"]:
+        assert len(httpx_mock.get_requests(url=f"https://nodeman/api/v1/node/{key_id}/public_key")) == 1
+
+    # All verified
+    (tmp_path / "verified.txt").write_text(messages[0] + "\n" + messages[1] + "\n")
+    main([*args, "--batch", str(tmp_path / "verified.txt")])
+    assert all(json.loads(line)["verified"] for line in capsys.readouterr().out.splitlines())
+
+
+def test_jws_legacy_key_resolver(tmp_path):
+    """Test resolvers without a refresh parameter"""
+
+    alg = "EdDSA"
+    key_id = "xyzzy"
+    old_private_key = ed25519.Ed25519PrivateKey.generate()
+    new_private_key = ed25519.Ed25519PrivateKey.generate()
+
+    class LegacyKeyResolver(KeyResolver):
+        def __init__(self):
+            super().__init__()
+            self.public_key = old_private_key.public_key()
+            self.calls = 0
+
+        def resolve_public_key(self, key_id: str):
+            self.calls += 1
+            return self.public_key
+
+    def sign(private_key) -> str:
+        client_jws = JWS(payload=json.dumps({"hello": "world"}))
+        client_jws.add_signature(key=JWK.from_pyca(private_key), alg=alg, protected={"kid": key_id, "alg": alg})
+        return client_jws.serialize()
+
+    key_resolver = LegacyKeyResolver()
+    keyset = ResolverJWKSet(key_resolver=key_resolver, refresh_interval=0)
+    jws = JWS()
+    jws.deserialize(sign(old_private_key))
+    keyset.verify_jws(jws)
+
+    # Rotated key is resolved again without refresh
+    key_resolver.public_key = new_private_key.public_key()
+    results = keyset.verify_many([sign(new_private_key), sign(new_private_key)])
+    assert [result.verified for result in results] == [True, True]
+    assert key_resolver.calls == 2
+
+
+def test_jws_verify_many_concurrent(tmp_path, monkeypatch):
+    """Test signature checks for different kids running concurrently"""
+
+    alg = "EdDSA"
+    messages = []
+    for n in range(8):
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        (tmp_path / f"node{n}.pem").write_bytes(
+            private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+            )
+        )
+        client_jws = JWS(payload=json.dumps({"hello": n}))
+        client_jws.add_signature(key=JWK.from_pyca(private_key), alg=alg, protected={"kid": f"node{n}", "alg": alg})
+        messages.append(client_jws.serialize())
+
+    verify_with_key = ResolverJWKSet._verify_with_key
+    lock = threading.Lock()
+    active = []
+    overlap = []
+
+    def slow_verify_with_key(jws: JWS, key: JWK, kid: str) -> bool:
+        with lock:
+            active.append(kid)
+            overlap.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(kid)
+        return verify_with_key(jws, key, kid)
+
+    monkeypatch.setattr(ResolverJWKSet, "_verify_with_key", staticmethod(slow_verify_with_key))
+
+    keyset = ResolverJWKSet(key_resolver=FileKeyResolver(client_database_directory=str(tmp_path)), max_workers=8)
+    assert all(result.verified for result in keyset.verify_many(messages))
+    assert max(overlap) > 1
+
+
+def test_jws_verifier_refresh_unavailable():
+    """Test forged messages not dropping a cached key while the key source is down"""
+
+    alg = "EdDSA"
+    key_id = "xyzzy"
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    forged_private_key = ed25519.Ed25519PrivateKey.generate()
+
+    class FlakyKeyResolver(KeyResolver):
+        def __init__(self):
+            super().__init__()
+            self.available = True
+
+        def resolve_public_key(self, key_id: str, refresh: bool = False):
+            if not self.available:
+                raise KeyUnavailableError(key_id)
+            return private_key.public_key()
+
+    def sign(private_key) -> str:
+        client_jws = JWS(payload=json.dumps({"hello": "world"}))
+        client_jws.add_signature(key=JWK.from_pyca(private_key), alg=alg, protected={"kid": key_id, "alg": alg})
+        return client_jws.serialize()
+
+    key_resolver = FlakyKeyResolver()
+    keyset = ResolverJWKSet(key_resolver=key_resolver, refresh_interval=0)
+    keyset.verify_jws(_deserialize(sign(private_key)))
+
+    key_resolver.available = False
+    with pytest.raises(JWKeyNotFound):
+        keyset.verify_jws(_deserialize(sign(forged_private_key)))
+    keyset.verify_jws(_deserialize(sign(private_key)))
+
+    results = keyset.verify_many([sign(forged_private_key), sign(private_key)])
+    assert [result.verified for result in results] == [False, True]
+    assert isinstance(results[0].error, JWKeyNotFound)
+    keyset.verify_jws(_deserialize(sign(private_key)))
@@ -1,8 +1,32 @@
+import asyncio
+import time
+
 import fakeredis
+import pytest
+import redis
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import ed25519
+from pydantic import ValidationError
 
-from dnstapir.key_cache import CombinedKeyCache, KeyCache, MemoryKeyCache, RedisKeyCache
+from dnstapir.key_cache import (
+    NEGATIVE,
+    AsyncCombinedKeyCache,
+    AsyncDummyKeyCache,
+    AsyncKeyCache,
+    AsyncMemoryKeyCache,
+    AsyncRedisKeyCache,
+    CircuitBreaker,
+    CombinedKeyCache,
+    DummyKeyCache,
+    KeyCache,
+    KeyCacheSettings,
+    MemoryKeyCache,
+    RedisKeyCache,
+    RedisSettings,
+    async_redis_client_from_settings,
+    key_cache_from_settings,
+    redis_client_from_settings,
+)
 
 
 def _test_key_cache(key_cache: KeyCache):
@@ -39,3 +63,241 @@ def test_memory_stack():
 
     key_cache = CombinedKeyCache([memory_key_cache, redis_key_cache])
     _test_key_cache(key_cache=key_cache)
+
+
+def _count_redis_round_trips(monkeypatch) -> list[bytes]:
+    round_trips = []
+    send_packed_command = redis.Connection.send_packed_command
+
+    def counting_send_packed_command(self, command, check_health=True):
+        round_trips.append(command)
+        return send_packed_command(self, command, check_health)
+
+    monkeypatch.setattr(redis.Connection, "send_packed_command", counting_send_packed_command)
+    return round_trips
+
+
+def test_memory_stack_read_through(monkeypatch):
+    key_id = "xyzzy"
+    redis_client = fakeredis.FakeRedis()
+    redis_client.ping()
+    memory_key_cache = MemoryKeyCache(size=100, ttl=60)
+    redis_key_cache = RedisKeyCache(redis_client=redis_client, ttl=60)
+    key_cache = CombinedKeyCache([memory_key_cache, redis_key_cache])
+
+    # Populated by another process, with 30 seconds left
+    redis_key_cache.set(key_id, b"public_key", ttl=30)
+    round_trips = _count_redis_round_trips(monkeypatch)
+
+    for _ in range(10):
+        assert key_cache.get(key_id) == b"public_key"
+
+    # A single round trip for GET and PTTL, then served from memory
+    assert len(round_trips) == 1
+
+    res, ttl = memory_key_cache.get_with_ttl(key_id)
+    assert res == b"public_key"
+    assert 0 < ttl <= 31
+
+
+def test_memory_cache_ttl():
+    key_cache = MemoryKeyCache(size=100, ttl=60)
+    key_cache.set("short", b"value", ttl=0.01)
+    key_cache.set("long", b"value", ttl=3600)
+    time.sleep(0.02)
+    assert key_cache.get("short") is None
+    assert key_cache.get_with_ttl("long")[1] <= 60
+
+
+def test_memory_cache_negative():
+    key_cache = MemoryKeyCache(size=10, ttl=60, negative_ttl=30)
+    key_cache.set("xyzzy", b"public_key")
+
+    # A flood of unknown keys does not evict known keys
+    for n in range(1000):
+        key_cache.set_negative(f"unknown{n}")
+    assert key_cache.get("xyzzy") == b"public_key"
+    assert key_cache.get("unknown999") == NEGATIVE
+    assert key_cache.get_with_ttl("unknown999")[1] <= 30
+    assert key_cache.get("unknown0") is None
+    assert len(key_cache.negative_cache) == 1
+
+    # Known key replaces unknown key
+    key_cache.set("unknown999", b"public_key")
+    assert key_cache.get("unknown999") == b"public_key"
+    key_cache.set_negative("unknown999")
+    assert key_cache.get("unknown999") == NEGATIVE
+
+
+def test_combined_cache_fan_out():
+    redis_key_caches = [RedisKeyCache(redis_client=fakeredis.FakeRedis(), ttl=60) for _ in range(2)]
+    key_cache = CombinedKeyCache([MemoryKeyCache(size=100, ttl=60), *redis_key_caches])
+    _test_key_cache(key_cache=key_cache)
+    for redis_key_cache in redis_key_caches:
+        assert redis_key_cache.get("xyzzy") is not None
+
+
+def _test_key_cache_many(key_cache: KeyCache):
+    items = {f"node{n}": f"public_key{n}".encode() for n in range(10)}
+
+    assert key_cache.get_many(items) == {}
+
+    key_cache.set_many(items)
+
+    assert key_cache.get_many([*items, "unknown"]) == items
+    assert key_cache.get("node1") == b"public_key1"
+
+
+def test_key_cache_many():
+    _test_key_cache_many(MemoryKeyCache(size=100, ttl=60))
+    _test_key_cache_many(RedisKeyCache(redis_client=fakeredis.FakeRedis(), ttl=60))
+    _test_key_cache_many(
+        CombinedKeyCache([MemoryKeyCache(size=100, ttl=60), RedisKeyCache(redis_client=fakeredis.FakeRedis(), ttl=60)])
+    )
+    assert DummyKeyCache().get_many(["node1"]) == {}
+
+
+def test_memory_stack_many_round_trips(monkeypatch):
+    redis_client = fakeredis.FakeRedis()
+    redis_client.ping()
+    memory_key_cache = MemoryKeyCache(size=100, ttl=60)
+    redis_key_cache = RedisKeyCache(redis_client=redis_client, ttl=60)
+    key_cache = CombinedKeyCache([memory_key_cache, redis_key_cache])
+    items = {f"node{n}": f"public_key{n}".encode() for n in range(10)}
+    round_trips = _count_redis_round_trips(monkeypatch)
+
+    # Pipelined SET ... EXAT
+    redis_key_cache.set_many(items)
+    assert len(round_trips) == 1
+
+    # Memory misses filled from a single Redis batch
+    memory_key_cache.set("node0", items["node0"])
+    assert key_cache.get_many(items) == items
+    assert len(round_trips) == 2
+
+    # Now all in memory
+    assert key_cache.get_many(items) == items
+    assert len(round_trips) == 2
+    assert memory_key_cache.get_many(items) == items
+
+
+def test_async_key_cache():
+    async def _test_async_key_cache(key_cache: AsyncKeyCache):
+        assert await key_cache.get("xyzzy") is None
+        await key_cache.set("xyzzy", b"public_key")
+        assert await key_cache.get("xyzzy") == b"public_key"
+        res, ttl = await key_cache.get_with_ttl("xyzzy")
+        assert res == b"public_key" and 0 < ttl <= 61
+
+        items = {f"node{n}": f"public_key{n}".encode() for n in range(10)}
+        await key_cache.set_many(items)
+        assert await key_cache.get_many([*items, "unknown"]) == items
+
+        await key_cache.set_negative("unknown")
+        assert await key_cache.get("unknown") == NEGATIVE
+        await key_cache.aclose()
+
+    async def _test_async_combined_key_cache():
+        redis_client = fakeredis.FakeAsyncRedis()
+        memory_key_cache = AsyncMemoryKeyCache(size=100, ttl=60, negative_ttl=10)
+        redis_key_cache = AsyncRedisKeyCache(redis_client=redis_client, ttl=60, negative_ttl=10)
+        key_cache = AsyncCombinedKeyCache([memory_key_cache, redis_key_cache])
+
+        # Read-through into memory
+        await redis_key_cache.set("plugh", b"public_key", ttl=10)
+        assert await key_cache.get("plugh") == b"public_key"
+        res, ttl = await memory_key_cache.get_with_ttl("plugh")
+        assert res == b"public_key" and 0 < ttl <= 11
+
+        await _test_async_key_cache(key_cache)
+
+    asyncio.run(_test_async_key_cache(AsyncMemoryKeyCache(size=100, ttl=60, negative_ttl=10)))
+    asyncio.run(_test_async_key_cache(AsyncRedisKeyCache(fakeredis.FakeAsyncRedis(), ttl=60, negative_ttl=10)))
+    asyncio.run(_test_async_combined_key_cache())
+    assert asyncio.run(AsyncDummyKeyCache().get_many(["node1"])) == {}
+
+
+def test_redis_settings():
+    with pytest.raises(ValidationError):
+        RedisSettings()
+
+    redis_client = redis_client_from_settings(
+        RedisSettings(unix_socket_path="/run/redis.sock", max_connections=4, socket_timeout=0.5)
+    )
+    connection_pool = redis_client.connection_pool
+    assert connection_pool.connection_class is redis.UnixDomainSocketConnection
+    assert connection_pool.max_connections == 4
+    assert connection_pool.connection_kwargs["socket_timeout"] == 0.5
+
+    redis_client = redis_client_from_settings(RedisSettings(sentinels=[("sentinel", 26379)]))
+    assert redis_client.connection_pool.service_name == "mymaster"
+
+    # Master database and credentials are not sent to Sentinels
+    settings = RedisSettings(sentinels=[("sentinel", 26379)], db=3, username="user", password="secret")
+    for client in [redis_client_from_settings(settings), async_redis_client_from_settings(settings)]:
+        assert client.connection_pool.connection_kwargs["password"] == "secret"
+        sentinel_kwargs = client.connection_pool.sentinel_manager.sentinels[0].connection_pool.connection_kwargs
+        assert sentinel_kwargs.get("db", 0) == 0
+        assert sentinel_kwargs.get("username") is None
+        assert sentinel_kwargs.get("password") is None
+        assert sentinel_kwargs["socket_timeout"] == 1.0
+
+    key_cache = key_cache_from_settings(KeyCacheSettings(redis=RedisSettings(host="localhost")))
+    assert isinstance(key_cache, CombinedKeyCache)
+    assert key_cache.caches[1].circuit_breaker.threshold == 5
+
+
+def test_redis_cache_circuit_breaker(monkeypatch):
+    redis_client = fakeredis.FakeRedis()
+    circuit_breaker = CircuitBreaker(threshold=2, reset_timeout=0.1)
+    key_cache = RedisKeyCache(redis_client=redis_client, ttl=60, circuit_breaker=circuit_breaker)
+    key_cache.set("xyzzy", b"public_key")
+
+    calls = []
+
+    def fail(*args, **kwargs):
+        calls.append(args)
+        raise redis.ConnectionError("down")
+
+    with monkeypatch.context() as m:
+        m.setattr(redis_client, "get", fail)
+        m.setattr(redis_client, "mget", fail)
+
+        # Errors degrade to misses until the circuit opens
+        assert key_cache.get("xyzzy") is None
+        assert key_cache.get_many(["xyzzy"]) == {}
+        assert circuit_breaker.is_open
+        assert key_cache.get("xyzzy") is None
+        assert len(calls) == 2
+
+        # A single trial call after reset_timeout
+        time.sleep(0.1)
+        assert key_cache.get("xyzzy") is None
+        assert key_cache.get("xyzzy") is None
+        assert len(calls) == 3
+
+    time.sleep(0.1)
+    assert key_cache.get("xyzzy") == b"public_key"
+    assert not circuit_breaker.is_open
+
+
+def test_redis_cache_lease():
+    key_cache = CombinedKeyCache(
+        [MemoryKeyCache(size=10, ttl=60), RedisKeyCache(redis_client=fakeredis.FakeRedis(), ttl=60)]
+    )
+    token = key_cache.acquire_lease("xyzzy", ttl=10)
+    assert token is not None
+    assert key_cache.acquire_lease("xyzzy", ttl=10) is None
+
+    # Only the holder can release
+    key_cache.release_lease("xyzzy", b"other")
+    assert key_cache.acquire_lease("xyzzy", ttl=10) is None
+    key_cache.release_lease("xyzzy", token)
+    assert key_cache.acquire_lease("xyzzy", ttl=0.05) is not None
+
+    # Leases expire
+    time.sleep(0.1)
+    assert key_cache.acquire_lease("xyzzy", ttl=10) is not None
+
+    # Local caches always grant leases
+    assert MemoryKeyCache(size=10, ttl=60).acquire_lease("xyzzy", ttl=10) is not None
@@ -0,0 +1,83 @@
+import os
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+from dnstapir.key_index import KeyDirectoryIndex
+from dnstapir.key_resolver import FileKeyResolver
+
+
+def _public_key_pem() -> bytes:
+    return (
+        ed25519.Ed25519PrivateKey.generate()
+        .public_key()
+        .public_bytes(encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo)
+    )
+
+
+def _wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timeout waiting for condition"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_key_directory_index(tmp_path, use_inotify: bool):
+    alice, bob = _public_key_pem(), _public_key_pem()
+    (tmp_path / "alice.pem").write_bytes(alice)
+    (tmp_path / "README").write_text("not a key")
+    (tmp_path / "keys").mkdir()
+    (tmp_path / "keys" / "carol").write_bytes(alice)
+
+    changes = []
+    index = KeyDirectoryIndex(tmp_path, poll_interval=0.05, use_inotify=use_inotify, on_change=changes.append)
+    with index:
+        assert index.keys == {"alice": alice}
+        assert changes == ["alice"]
+
+        # Atomic rename into place
+        (tmp_path / "bob.tmp").write_bytes(bob)
+        os.replace(tmp_path / "bob.tmp", tmp_path / "bob.pem")
+        _wait_for(lambda: index.get("bob") == bob)
+
+        # Symlink and hard link
+        (tmp_path / "carol.pem").symlink_to(tmp_path / "keys" / "carol")
+        _wait_for(lambda: index.get("carol") == alice)
+        os.link(tmp_path / "keys" / "carol", tmp_path / "dave.pem")
+        _wait_for(lambda: index.get("dave") == alice)
+
+        # Rewrite in place
+        (tmp_path / "alice.pem").write_bytes(bob)
+        _wait_for(lambda: index.get("alice") == bob)
+
+        # Removal
+        (tmp_path / "alice.pem").unlink()
+        _wait_for(lambda: index.get("alice") is None)
+
+    assert changes.count("alice") == 3
+
+
+def test_file_key_resolver_index(tmp_path):
+    public_key_pem = _public_key_pem()
+    (tmp_path / "xyzzy.pem").write_bytes(public_key_pem)
+
+    with FileKeyResolver(
+        client_database_directory=str(tmp_path), public_key_cache_size=10, index=True, index_poll_interval=0.05
+    ) as resolver:
+        public_key = resolver.resolve_public_key("xyzzy")
+        assert resolver.list_key_ids() == ["xyzzy"]
+        with pytest.raises(KeyError):
+            resolver.resolve_public_key("unknown")
+
+        # Changed keys are dropped from the public key cache
+        (tmp_path / "xyzzy.pem").write_bytes(_public_key_pem())
+        _wait_for(lambda: "xyzzy" not in resolver.public_key_cache)
+        assert resolver.resolve_public_key("xyzzy") != public_key
+
+        (tmp_path / "xyzzy.pem").unlink()
+        _wait_for(lambda: "xyzzy" not in resolver.index.keys)
+        with pytest.raises(KeyError):
+            resolver.resolve_public_key("xyzzy")
@@ -1,12 +1,28 @@
+import asyncio
+import gc
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
+import fakeredis
+import httpx
 import pytest
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, rsa
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
 from pytest_httpx import HTTPXMock
 
-from dnstapir.key_resolver import FileKeyResolver, UrlKeyResolver
+from dnstapir.key_cache import CombinedKeyCache, MemoryKeyCache, RedisKeyCache
+from dnstapir.key_resolver import (
+    AsyncCacheKeyResolver,
+    AsyncUrlKeyResolver,
+    FileKeyResolver,
+    KeyUnavailableError,
+    UrlKeyResolver,
+    decode_public_key,
+    encode_public_key,
+)
 
 
 def test_file_key_resolver(httpx_mock: HTTPXMock):
@@ -104,3 +120,339 @@ def test_url_key_resolver_contextlib(httpx_mock: HTTPXMock):
 
     with pytest.raises(KeyError):
         _ = resolver.resolve_public_key("unknown")
+
+
+def test_async_url_key_resolver(httpx_mock: HTTPXMock):
+    key_id = "xyzzy"
+    public_key = ed25519.Ed25519PrivateKey.generate().public_key()
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+    # Only one response each, so concurrent lookups must be coalesced
+    httpx_mock.add_response(url=f"https://nodeman/api/v1/node/{key_id}/public_key", content=public_key_pem)
+    httpx_mock.add_response(url="https://nodeman/api/v1/node/unknown/public_key", status_code=404)
+
+    async def resolve():
+        async with AsyncUrlKeyResolver(
+            client_database_base_url="https://nodeman/api/v1/node/{key_id}/public_key",
+            key_cache=MemoryKeyCache(size=100, ttl=60),
+        ) as resolver:
+            res = await asyncio.gather(*[resolver.resolve_public_key(key_id) for _ in range(10)])
+            assert all(key == public_key for key in res)
+            assert not resolver._inflight
+
+            res = await asyncio.gather(
+                *[resolver.resolve_public_key("unknown") for _ in range(10)], return_exceptions=True
+            )
+            assert all(isinstance(exc, KeyError) for exc in res)
+
+            # Cache hit
+            assert await resolver.resolve_public_key(key_id) == public_key
+
+            with pytest.raises(ValueError):
+                _ = await resolver.resolve_public_key("🔐")
+
+    asyncio.run(resolve())
+
+    request = httpx_mock.get_request(url=f"https://nodeman/api/v1/node/{key_id}/public_key")
+    assert request.headers["Accept"] == "application/x-pem-file"
+    assert len(httpx_mock.get_requests(url="https://nodeman/api/v1/node/unknown/public_key")) == 1
+
+
+def test_file_key_resolver_public_key_cache():
+    key_id = "xyzzy"
+    public_key = ed25519.Ed25519PrivateKey.generate().public_key()
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+    with TemporaryDirectory(prefix="dnstapir") as directory:
+        pem_filename = Path(directory) / f"{key_id}.pem"
+        with open(pem_filename, "wb") as fp:
+            fp.write(public_key_pem)
+
+        resolver = FileKeyResolver(client_database_directory=directory, public_key_cache_size=10)
+        res = resolver.resolve_public_key(key_id)
+        assert res == public_key
+
+        # Parsed key is served from memory
+        pem_filename.unlink()
+        assert resolver.resolve_public_key(key_id) is res
+
+        with pytest.raises(KeyError):
+            _ = resolver.resolve_public_key("unknown")
+
+
+def test_url_key_resolver_negative_cache(httpx_mock: HTTPXMock):
+    url = "https://keys/unknown.pem"
+    httpx_mock.add_response(url=url, status_code=404, is_reusable=True)
+
+    redis_client = fakeredis.FakeRedis()
+
+    def key_cache(negative_ttl: int) -> CombinedKeyCache:
+        return CombinedKeyCache(
+            [
+                MemoryKeyCache(size=10, ttl=60, negative_ttl=negative_ttl),
+                RedisKeyCache(redis_client=redis_client, ttl=60, negative_ttl=negative_ttl),
+            ]
+        )
+
+    # Without negative caching, every lookup is fetched
+    resolver = UrlKeyResolver(client_database_base_url="https://keys", key_cache=key_cache(negative_ttl=0))
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            resolver.resolve_public_key("unknown")
+    assert len(httpx_mock.get_requests(url=url)) == 2
+
+    # With negative caching, unknown keys are fetched once
+    resolver = UrlKeyResolver(client_database_base_url="https://keys", key_cache=key_cache(negative_ttl=10))
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            resolver.resolve_public_key("unknown")
+    assert len(httpx_mock.get_requests(url=url)) == 3
+
+    # Negative results are shared via Redis
+    resolver = UrlKeyResolver(client_database_base_url="https://keys", key_cache=key_cache(negative_ttl=10))
+    with pytest.raises(KeyError):
+        resolver.resolve_public_key("unknown")
+    assert len(httpx_mock.get_requests(url=url)) == 3
+    assert 0 < redis_client.ttl("unknown") <= 11
+
+    # Refresh bypasses the negative cache
+    with pytest.raises(KeyError):
+        resolver.resolve_public_key("unknown", refresh=True)
+    assert len(httpx_mock.get_requests(url=url)) == 4
+
+
+def test_url_key_resolver_refresh_ahead_and_stale(httpx_mock: HTTPXMock):
+    url = "https://keys/xyzzy.pem"
+    public_key = ed25519.Ed25519PrivateKey.generate().public_key()
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    httpx_mock.add_response(url=url, content=public_key_pem)
+    httpx_mock.add_response(url=url, content=public_key_pem)
+    httpx_mock.add_response(url=url, status_code=503, is_reusable=True)
+
+    # Every cached key is within refresh_ahead of expiry
+    resolver = UrlKeyResolver(
+        client_database_base_url="https://keys",
+        key_cache=MemoryKeyCache(size=10, ttl=60, negative_ttl=60),
+        refresh_ahead=120,
+        max_stale=0.5,
+    )
+    assert resolver.resolve_public_key("xyzzy") == public_key
+    assert len(httpx_mock.get_requests(url=url)) == 1
+
+    # Cached key is served while refreshed in the background
+    assert resolver.resolve_public_key("xyzzy") == public_key
+    resolver._refresh_executor.shutdown(wait=True)
+    assert len(httpx_mock.get_requests(url=url)) == 2
+
+    # Stale key is served while the key source is unavailable, and not negatively cached
+    assert resolver.resolve_public_key("xyzzy", refresh=True) == public_key
+    assert len(httpx_mock.get_requests(url=url)) == 3
+    assert resolver.key_cache.get("xyzzy") == encode_public_key(public_key)
+
+    # ... but not beyond max_stale
+    time.sleep(0.6)
+    with pytest.raises(KeyUnavailableError):
+        resolver.resolve_public_key("xyzzy", refresh=True)
+
+
+def test_url_key_resolver_refresh_ahead_public_key_cache(httpx_mock: HTTPXMock):
+    url = "https://keys/xyzzy.pem"
+    public_key = ed25519.Ed25519PrivateKey.generate().public_key()
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    httpx_mock.add_response(url=url, content=public_key_pem, is_reusable=True)
+
+    resolver = UrlKeyResolver(
+        client_database_base_url="https://keys",
+        key_cache=MemoryKeyCache(size=10, ttl=60),
+        public_key_cache_size=10,
+        public_key_cache_ttl=2,
+        refresh_ahead=0.5,
+    )
+    assert resolver.resolve_public_key("xyzzy") == public_key
+    assert resolver.resolve_public_key("xyzzy") == public_key
+    assert len(httpx_mock.get_requests(url=url)) == 1
+    assert resolver._refresh_executor is None
+
+    # Parsed key about to expire is served while refreshed in the background
+    time.sleep(1.6)
+    assert resolver.resolve_public_key("xyzzy") == public_key
+    resolver._refresh_executor.shutdown(wait=True)
+    assert len(httpx_mock.get_requests(url=url)) == 2
+
+    # ... and is still cached past its original expiry
+    time.sleep(0.6)
+    assert resolver.resolve_public_key("xyzzy") == public_key
+    assert len(httpx_mock.get_requests(url=url)) == 2
+
+
+def test_key_resolver_warm_up(httpx_mock: HTTPXMock):
+    public_key_pems = {
+        f"node{n}": ed25519.Ed25519PrivateKey.generate()
+        .public_key()
+        .public_bytes(encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo)
+        for n in range(5)
+    }
+    encoded_public_keys = {
+        key_id: encode_public_key(load_pem_public_key(public_key_pem))
+        for key_id, public_key_pem in public_key_pems.items()
+    }
+
+    with TemporaryDirectory(prefix="dnstapir") as directory:
+        for key_id, public_key_pem in public_key_pems.items():
+            with open(Path(directory) / f"{key_id}.pem", "wb") as fp:
+                fp.write(public_key_pem)
+        with open(Path(directory) / "broken.pem", "wb") as fp:
+            fp.write(b"xyzzy")
+
+        key_cache = MemoryKeyCache(size=10, ttl=60)
+        resolver = FileKeyResolver(client_database_directory=directory, key_cache=key_cache, public_key_cache_size=10)
+        assert resolver.warm_up(batch_size=2) == len(public_key_pems)
+        assert key_cache.get_many(public_key_pems) == encoded_public_keys
+        assert key_cache.get("broken") is None
+        assert set(resolver.public_key_cache.keys()) == set(public_key_pems)
+
+        # Cached keys are not fetched again
+        assert resolver.warm_up() == 0
+
+    for key_id, public_key_pem in public_key_pems.items():
+        httpx_mock.add_response(url=f"https://keys/{key_id}.pem", content=public_key_pem)
+    httpx_mock.add_response(url="https://keys/unknown.pem", status_code=404)
+
+    key_cache = MemoryKeyCache(size=10, ttl=60)
+    resolver = UrlKeyResolver(client_database_base_url="https://keys", key_cache=key_cache)
+    assert resolver.warm_up([*public_key_pems, "unknown"], max_workers=4) == len(public_key_pems)
+    assert key_cache.get_many(public_key_pems) == encoded_public_keys
+
+    with pytest.raises(ValueError):
+        resolver.warm_up()
+
+
+def test_public_key_encoding():
+    private_keys = [
+        ed25519.Ed25519PrivateKey.generate(),
+        ed448.Ed448PrivateKey.generate(),
+        ec.generate_private_key(ec.SECP256R1()),
+        rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    ]
+    for private_key in private_keys:
+        public_key = private_key.public_key()
+        public_key_pem = public_key.public_bytes(
+            encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        encoded = encode_public_key(public_key)
+        assert len(encoded) < len(public_key_pem)
+        assert decode_public_key(encoded) == public_key
+        # Existing PEM cache entries are still understood
+        assert decode_public_key(public_key_pem) == public_key
+
+    assert len(encode_public_key(private_keys[0].public_key())) == 33
+
+
+def test_url_key_resolver_pem_key_cache(httpx_mock: HTTPXMock):
+    public_key = ed25519.Ed25519PrivateKey.generate().public_key()
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    httpx_mock.add_response(url="https://keys/xyzzy.pem", content=public_key_pem)
+
+    # Compact encoding disabled, e.g. while sharing a cache with older versions
+    key_cache = MemoryKeyCache(size=10, ttl=60)
+    resolver = UrlKeyResolver(client_database_base_url="https://keys", key_cache=key_cache, compact_keys=False)
+    assert resolver.resolve_public_key("xyzzy") == public_key
+    assert key_cache.get("xyzzy") == public_key_pem
+
+    # PEM entries are read by resolvers using the compact encoding
+    resolver = UrlKeyResolver(client_database_base_url="https://keys", key_cache=key_cache)
+    assert resolver.resolve_public_key("xyzzy") == public_key
+
+
+def test_async_key_resolver_cancelled_fetch():
+    class FailingKeyResolver(AsyncCacheKeyResolver):
+        def __init__(self):
+            super().__init__(key_cache=None)
+            self.event = asyncio.Event()
+
+        async def get_public_key_pem(self, key_id: str) -> bytes:
+            await self.event.wait()
+            raise KeyUnavailableError(key_id)
+
+    errors = []
+
+    async def resolve():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        resolver = FailingKeyResolver()
+        tasks = [asyncio.create_task(resolver.resolve_public_key("xyzzy")) for _ in range(3)]
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Shared fetch fails after every caller is gone
+        resolver.event.set()
+        while resolver._inflight:
+            await asyncio.sleep(0)
+        del tasks
+        gc.collect()
+
+    asyncio.run(resolve())
+    assert errors == []
+
+
+def test_url_key_resolver_single_flight(httpx_mock: HTTPXMock):
+    url = "https://keys/xyzzy.pem"
+    public_key = ed25519.Ed25519PrivateKey.generate().public_key()
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+    def slow_response(request: httpx.Request) -> httpx.Response:
+        time.sleep(0.2)
+        return httpx.Response(status_code=200, content=public_key_pem)
+
+    httpx_mock.add_callback(slow_response, url=url, is_reusable=True)
+
+    # Each resolver stands in for a separate process sharing Redis
+    server = fakeredis.FakeServer()
+    resolvers = [
+        UrlKeyResolver(
+            client_database_base_url="https://keys",
+            key_cache=RedisKeyCache(redis_client=fakeredis.FakeRedis(server=server), ttl=60),
+            single_flight=True,
+        )
+        for _ in range(5)
+    ]
+    with ThreadPoolExecutor(max_workers=len(resolvers)) as executor:
+        results = list(executor.map(lambda resolver: resolver.resolve_public_key("xyzzy"), resolvers))
+
+    assert results == [public_key] * len(resolvers)
+    assert len(httpx_mock.get_requests(url=url)) == 1
+    assert fakeredis.FakeRedis(server=server).get("lease:xyzzy") is None
+
+
+def test_url_key_resolver_single_flight_failure(httpx_mock: HTTPXMock):
+    url = "https://keys/xyzzy.pem"
+    httpx_mock.add_response(url=url, status_code=503, is_reusable=True)
+
+    key_cache = RedisKeyCache(redis_client=fakeredis.FakeRedis(), ttl=60)
+    resolver = UrlKeyResolver(client_database_base_url="https://keys", key_cache=key_cache, single_flight=True)
+
+    # Lease is released when the fetch fails
+    with pytest.raises(KeyUnavailableError):
+        resolver.resolve_public_key("xyzzy")
+    assert key_cache.redis_client.get("lease:xyzzy") is None
+
+    # Lease held elsewhere, fetch anyway after waiting
+    resolver.lease_wait = 0.1
+    token = key_cache.acquire_lease("xyzzy", ttl=10)
+    with pytest.raises(KeyUnavailableError):
+        resolver.resolve_public_key("xyzzy")
+    assert len(httpx_mock.get_requests(url=url)) == 2
+    assert key_cache.redis_client.get("lease:xyzzy") == token